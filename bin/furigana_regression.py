@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Run furigana alignment over every (kanji, reading) pair in JMdict (and
+optionally the words with readings in the Tanaka corpus), reporting how
+often each kind of alignment happens, how long alignments take, and overall
+throughput.  Results can be saved as a baseline, and later runs compared
+against it, in which case the exit status is non-zero if anything has gotten
+noticeably worse.
+
+Note that this needs the generated dictionary data (see README.txt).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jptext import charset  # noqa: E402
+from jptext import furigana  # noqa: E402
+from jptext import jmdict  # noqa: E402
+from jptext import kanjidic  # noqa: E402
+
+OUTCOMES = (furigana.MATCH_EXACT, furigana.MATCH_WILDCARD, furigana.MATCH_GROUP, "error")
+RATE_KEYS = {furigana.MATCH_EXACT: -1, furigana.MATCH_WILDCARD: 1, furigana.MATCH_GROUP: 1, "error": 1}
+LATENCY_KEYS = ("p50_us", "p90_us", "p99_us")
+BATCH_SIZE = 2000
+
+kanji_re = re.compile("[" + charset.kanji.re_range_nosym + "]")
+b_word_re = re.compile(r"([^[({~]*)(?:\(([^)]*)\))?")
+
+
+def warn(msg):
+    sys.stderr.write("WARNING: {}\n".format(msg))
+
+
+def jmdict_pairs():
+    return jmdict._default_jmdict().kanji_reading_pairs()
+
+
+def tanaka_pairs(filename):
+    with open(filename, "r") as f:
+        for line in f:
+            if not line.startswith("B:"):
+                continue
+            for word in line.split()[1:]:
+                m = b_word_re.match(word)
+                if m.group(2):
+                    yield (m.group(1), m.group(2))
+
+
+def word_outcome(outcomes):
+    # The outcome for a whole word is the worst of its kanji runs
+    for outcome in reversed(OUTCOMES):
+        if outcome in outcomes:
+            return outcome
+    return furigana.MATCH_EXACT
+
+
+def measure(pairs):
+    counts = dict.fromkeys(OUTCOMES, 0)
+    latencies = []
+    overhead = 0.0
+    timer = time.perf_counter
+    for kanji, reading in pairs:
+        outcomes = []
+        # Each timing should be the full cost of one alignment, not of
+        # looking up an alignment an earlier pair left in the caches.  (The
+        # kanji reading tables are kept, as they would be in normal use.)
+        start = timer()
+        furigana.alignment_cache.clear()
+        furigana.pattern_cache.clear()
+        overhead += timer() - start
+        start = timer()
+        try:
+            furigana.align_furi(kanji, reading, outcomes)
+        except furigana.FuriganaError:
+            outcomes = ["error"]
+        latencies.append(timer() - start)
+        counts[word_outcome(outcomes)] += 1
+    return counts, latencies, overhead
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(pairs, jobs):
+    # Only pairs with kanji in them are interesting (and each only once)
+    pairs = [p for p in dict.fromkeys(pairs) if kanji_re.search(p[0])]
+    batches = [pairs[i : i + BATCH_SIZE] for i in range(0, len(pairs), BATCH_SIZE)]
+    counts = dict.fromkeys(OUTCOMES, 0)
+    latencies = []
+    start = time.perf_counter()
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = list(pool.imap_unordered(measure, batches))
+    else:
+        results = [measure(batch) for batch in batches]
+    elapsed = time.perf_counter() - start
+    overhead = 0.0
+    for batch_counts, batch_latencies, batch_overhead in results:
+        for k, v in batch_counts.items():
+            counts[k] += v
+        latencies.extend(batch_latencies)
+        overhead += batch_overhead
+    # Leave out the time spent clearing the caches (spread over the workers)
+    elapsed -= overhead / max(jobs, 1)
+    latencies.sort()
+    total = len(pairs)
+    report = {"pairs": total}
+    for outcome in OUTCOMES:
+        report[outcome] = counts[outcome] / total if total else 0.0
+    report["p50_us"] = percentile(latencies, 0.50) * 1e6
+    report["p90_us"] = percentile(latencies, 0.90) * 1e6
+    report["p99_us"] = percentile(latencies, 0.99) * 1e6
+    report["pairs_per_sec"] = total / elapsed if elapsed else 0.0
+    return report
+
+
+def compare(results, baseline, tolerance, latency_tolerance):
+    problems = []
+    for source, report in sorted(results.items()):
+        base = baseline.get(source)
+        if not base:
+            continue
+        for key, direction in RATE_KEYS.items():
+            change = (report[key] - base[key]) * direction
+            if change > tolerance:
+                problems.append("{}: {} rate went from {:.4f} to {:.4f}".format(source, key, base[key], report[key]))
+        for key in LATENCY_KEYS:
+            if base[key] and report[key] > base[key] * (1 + latency_tolerance):
+                problems.append("{}: {} went from {:.1f} to {:.1f}".format(source, key, base[key], report[key]))
+        if report["pairs_per_sec"] < base["pairs_per_sec"] * (1 - latency_tolerance):
+            problems.append(
+                "{}: throughput went from {:.0f}/s to {:.0f}/s".format(
+                    source, base["pairs_per_sec"], report["pairs_per_sec"]
+                )
+            )
+    return problems
+
+
+def print_report(results):
+    for source, report in sorted(results.items()):
+        print("{} ({} pairs):".format(source, report["pairs"]))
+        print("    " + "  ".join("{} {:.2%}".format(k, report[k]) for k in OUTCOMES))
+        print("    " + "  ".join("{} {:.1f}".format(k, report[k]) for k in LATENCY_KEYS))
+        print("    {:.0f} pairs/sec".format(report["pairs_per_sec"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--tanaka", metavar="FILE", help="Also check the words in this Tanaka corpus file")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare the results against this baseline")
+    parser.add_argument("--write-baseline", metavar="FILE", help="Save the results as a new baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.002, help="Allowed change in outcome rates (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative change in latency/throughput (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    # Load everything before the worker processes get forked
+    kanjidic._default_kanjidict()
+    results = {"jmdict": run(jmdict_pairs(), args.jobs)}
+    if args.tanaka:
+        results["tanaka"] = run(tanaka_pairs(args.tanaka), args.jobs)
+    print_report(results)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.latency_tolerance)
+        for problem in problems:
+            warn(problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import xml.etree.ElementTree
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jptext import charset  # noqa: E402
+from jptext import furigana  # noqa: E402
+from jptext import jmdict  # noqa: E402
+from jptext import romaji  # noqa: E402
+
 # fmt: off
 LANG_CONV = {
     'aar': 'aa', 'abk': 'ab', 'afr': 'af', 'aka': 'ak',
@@ -477,6 +484,10 @@ def parse_r_ele(elem):
         "re_pri": parse_list(elem, "re_pri"),
     }
     add_if_present(data, elem, "re_nokanji", True)
+    # Normalized romaji for searching (see JMDict.lookup_romaji())
+    data["romaji"] = romaji.search_key(data["reb"])
+    # For sorting readings in gojūon order (see JMDict.sorted_readings())
+    data["collation_key"] = charset.collation_key(data["reb"])
     return {k: v for k, v in data.items() if v}
 
 
@@ -668,8 +679,33 @@ def postprocess(entries):
         entry['sense'] = senses
 
 
+def furigana_alignments(entries):
+    # Note: This uses the kanjidic readings, so jptext/_kanjidic_data.py needs
+    # to have been generated first.
+    results = {}
+    failed = 0
+    for keb, reb in jmdict.JMDict(entries).kanji_reading_pairs():
+        try:
+            segments = furigana.align_furi(keb, reb)
+        except furigana.FuriganaError:
+            failed += 1
+            continue
+        # Stored compactly as alternating (kanji length, reading length)
+        # pairs, with a reading length of 0 for kana segments (see
+        # JMDict.lookup_furigana())
+        lengths = []
+        for text, furi in segments:
+            lengths.append(len(text))
+            lengths.append(len(furi) if furi else 0)
+        results[(keb, reb)] = tuple(lengths)
+    if failed:
+        warn("Could not align furigana for {} kanji/reading pairs".format(failed))
+    return results
+
+
 entries = load_xml(sys.argv[1])
 postprocess(entries)
+furigana_table = furigana_alignments(entries)
 
 sys.stdout.write("# -*- coding: utf-8 -*-\n")
 sys.stdout.write("from __future__ import unicode_literals\n")
@@ -677,4 +713,9 @@ sys.stdout.write("\n")
 
 sys.stdout.write("entries = ")
 print_list(entries, "")
-sys.stdout.write("\n")
+sys.stdout.write("\n\n")
+
+sys.stdout.write("furigana = {\n")
+for key, value in sorted(furigana_table.items()):
+    sys.stdout.write("    {!r}: {!r},\n".format(key, value))
+sys.stdout.write("}\n")
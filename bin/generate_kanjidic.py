@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import xml.etree.ElementTree
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jptext import furigana  # noqa: E402
+
 
 def parse_list(elem, subelem_name):
     if elem is None:
@@ -86,6 +90,15 @@ def parse_reading_meaning(elem):
     return results
 
 
+def all_readings(reading_meaning):
+    return [
+        r[""]
+        for r_type in ("ja_on", "ja_kun")
+        for rmg in reading_meaning["rmgroup"]
+        for r in rmg["reading"].get(r_type, [])
+    ]
+
+
 def load_xml(filename):
     tree = xml.etree.ElementTree.parse(filename)
     root = tree.getroot()
@@ -106,6 +119,7 @@ def load_xml(filename):
             "query_code": parse_dict_with_attrs(elem.find("query_code"), "q_code", "qc_type"),
             "reading_meaning": parse_reading_meaning(elem.find("reading_meaning")),
         }
+        data["furigana_readings"] = furigana.expand_readings(all_readings(data["reading_meaning"]))
         characters.append(data)
     return (header, characters)
 
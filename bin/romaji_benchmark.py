@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Time romanizing every reading in JMdict, one at a time with kana_to_romaji()
+and as a batch with kana_to_romaji_many(), checking that both give the same
+results.
+
+Note that this needs the generated dictionary data (see README.txt), unless
+--file is used to time the lines of some other text instead.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jptext import jmdict  # noqa: E402
+from jptext import romaji  # noqa: E402
+
+
+def jmdict_readings():
+    return [r for entry in jmdict._default_jmdict().entries() for r in entry.readings]
+
+
+def file_lines(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Number of runs to take the best of")
+    parser.add_argument("--macron", action="store_true", help="Use macrons for long vowels")
+    parser.add_argument("--file", metavar="FILE", help="Time the lines of this file instead of the JMdict readings")
+    args = parser.parse_args()
+
+    macron = "̄" if args.macron else None
+    readings = file_lines(args.file) if args.file else jmdict_readings()
+    single_time, single = best_time(lambda: [romaji.kana_to_romaji(r, macron=macron) for r in readings], args.repeat)
+    batch_time, batch = best_time(lambda: romaji.kana_to_romaji_many(readings, macron=macron), args.repeat)
+    if single != batch:
+        mismatches = sum(1 for a, b in zip(single, batch) if a != b)
+        sys.stderr.write("ERROR: {} readings converted differently\n".format(mismatches))
+        sys.exit(1)
+
+    print("{} readings ({} characters)".format(len(readings), sum(len(r) for r in readings)))
+    print("    kana_to_romaji:      {:.3f}s ({:.0f}/sec)".format(single_time, len(readings) / single_time))
+    print("    kana_to_romaji_many: {:.3f}s ({:.0f}/sec)".format(batch_time, len(readings) / batch_time))
+    if args.file:
+        text = "\n".join(readings)
+        whole_time = best_time(lambda: romaji.kana_to_romaji(text, macron=macron), args.repeat)[0]
+        print("    whole file:          {:.3f}s ({:.0f} characters/sec)".format(whole_time, len(text) / whole_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import functools
 import unicodedata
 import re
 
+SCRIPT_OTHER = 0
+SCRIPT_HIRAGANA = 1
+SCRIPT_KATAKANA = 2
+SCRIPT_KATAKANA_HALFWIDTH = 3
+SCRIPT_KANJI = 4
+SCRIPT_PUNCTUATION = 5
+SCRIPT_NUMBER = 6
+SCRIPT_LATIN = 7
+
 
 class CharacterSet(object):
     pass
@@ -174,6 +184,97 @@ class jptext(CharacterSet):
     re_range = jptext_fullwidth.re_range + katakana_halfwidth.re_range
 
 
+def _range_codepoints(re_range):
+    "Yield every codepoint in a regex character class range string"
+    for m in re.finditer("(.)-(.)|(.)", re_range, re.DOTALL):
+        if m.group(3):
+            yield ord(m.group(3))
+        else:
+            yield from range(ord(m.group(1)), ord(m.group(2)) + 1)
+
+
+def _build_script_table():
+    # Later entries take precedence over earlier ones (e.g. '々' is in the
+    # punctuation range, but is really a kanji)
+    table = bytearray(0x10000)
+    for script, re_range in (
+        (SCRIPT_LATIN, "A-Za-z\uff21-\uff3a\uff41-\uff5a"),
+        (SCRIPT_PUNCTUATION, re_range_all_punct),
+        (SCRIPT_NUMBER, re_range_all_numbers),
+        (SCRIPT_HIRAGANA, hiragana.re_range_block),
+        (SCRIPT_KATAKANA, katakana.re_range_block),
+        (SCRIPT_KATAKANA_HALFWIDTH, katakana_halfwidth.re_range_block),
+        (SCRIPT_KANJI, kanji.re_range_nosym),
+    ):
+        for cp in _range_codepoints(re_range):
+            table[cp] = script
+    return table
+
+
+_script_table = _build_script_table()
+
+
+def script_of(ch):
+    "Return the SCRIPT_* constant for a single character"
+    cp = ord(ch)
+    return _script_table[cp] if cp < 0x10000 else SCRIPT_OTHER
+
+
+def _build_script_run_re():
+    # One alternative per script, each matching a run of that script (with
+    # anything not in the table at all being SCRIPT_OTHER)
+    ranges = {}
+    for cp, script in enumerate(_script_table):
+        if script:
+            script_ranges = ranges.setdefault(script, [])
+            if script_ranges and script_ranges[-1][1] == cp - 1:
+                script_ranges[-1][1] = cp
+            else:
+                script_ranges.append([cp, cp])
+    alternatives = []
+    scripts = []
+    known = ""
+    for script, script_ranges in sorted(ranges.items()):
+        re_range = "".join("{}-{}".format(re.escape(chr(a)), re.escape(chr(b))) for a, b in script_ranges)
+        alternatives.append("([{}]+)".format(re_range))
+        scripts.append(script)
+        known += re_range
+    alternatives.append("([^{}]+)".format(known))
+    scripts.append(SCRIPT_OTHER)
+    return re.compile("|".join(alternatives)), (None,) + tuple(scripts)
+
+
+_script_run_re, _script_run_groups = _build_script_run_re()
+
+
+def script_runs(text):
+    """
+    Split text into runs of characters of the same script (see script_of()),
+    yielding (script, start, end) for each.  `text` may be a string, or an
+    iterable of strings (such as an open file), in which case the offsets
+    are from the start of the first chunk, and runs continue across chunk
+    boundaries.
+    """
+    if isinstance(text, str):
+        text = (text,)
+    pending = None  # The last run so far, which might continue in the next chunk
+    offset = 0
+    for chunk in text:
+        for m in _script_run_re.finditer(chunk):
+            script = _script_run_groups[m.lastindex]
+            start = offset + m.start()
+            if pending is not None:
+                if pending[0] == script:
+                    # (Can only happen at the start of a chunk)
+                    start = pending[1]
+                else:
+                    yield (pending[0], pending[1], start)
+            pending = (script, start)
+        offset += len(chunk)
+    if pending is not None:
+        yield (pending[0], pending[1], offset)
+
+
 _hiragana_to_katakana_trmap = {ord(a): ord(b) for a, b in zip(hiragana._trans_set, katakana._trans_set)}
 _katakana_to_hiragana_trmap = {ord(a): ord(b) for a, b in zip(katakana._trans_set, hiragana._trans_set)}
 _kkfw_to_kkhw_trmap = {ord(a): ord(b) for a, b in zip(katakana._trans_set, katakana_halfwidth._trans_set) if b != " "}
@@ -182,6 +283,31 @@ _asciifw_to_asciihw_trmap = {ord(a): ord(b) for a, b in zip(fullwidth.ascii, hal
 _asciihw_to_asciifw_trmap = {ord(a): ord(b) for a, b in zip(halfwidth.ascii, fullwidth.ascii)}
 
 
+def _build_kkhw_voiced_map():
+    # Halfwidth katakana followed by a halfwidth (han)dakuten, and the single
+    # fullwidth character they become
+    result = {}
+    for c in katakana_halfwidth.large:
+        for mark, combining in (("ﾞ", "\u3099"), ("ﾟ", "\u309a")):
+            composed = unicodedata.normalize("NFC", chr(_kkhw_to_kkfw_trmap[ord(c)]) + combining)
+            if len(composed) == 1:
+                result[c + mark] = composed
+    return result
+
+
+_kkhw_voiced_to_kkfw = _build_kkhw_voiced_map()
+# Only the pairs which actually compose (e.g. ｶﾞ, but not ｶﾟ)
+_kkhw_voiced_re = re.compile(
+    "("
+    + "|".join(
+        "[" + "".join(sorted(k[0] for k in _kkhw_voiced_to_kkfw if k[1] == mark)) + "]" + mark for mark in "ﾞﾟ"
+    )
+    + ")"
+)
+_kkfw_to_kkhw_voiced_trmap = dict(_kkfw_to_kkhw_trmap)
+_kkfw_to_kkhw_voiced_trmap.update({ord(fw): hw for hw, fw in _kkhw_voiced_to_kkfw.items()})
+
+
 def hiragana_to_katakana(text):
     return text.translate(_hiragana_to_katakana_trmap)
 
@@ -191,16 +317,20 @@ def katakana_to_hiragana(text):
 
 
 def katakana_fullwidth_to_halfwidth(text):
-    text = unicodedata.normalize("NFD", text)
-    text = text.translate(_kkfw_to_kkhw_trmap)
-    text = unicodedata.normalize("NFC", text)
-    return text
+    # Voiced katakana map to two halfwidth characters (e.g. ガ -> ｶﾞ)
+    return text.translate(_kkfw_to_kkhw_voiced_trmap)
 
 
 def katakana_halfwidth_to_fullwidth(text):
-    text = text.translate(_kkhw_to_kkfw_trmap)
-    text = unicodedata.normalize("NFC", text)
-    return text
+    parts = _kkhw_voiced_re.split(text)
+    if len(parts) == 1:
+        return text.translate(_kkhw_to_kkfw_trmap)
+    # split() puts the voiced pairs (e.g. ｶﾞ) at the odd indexes
+    for i in range(0, len(parts), 2):
+        parts[i] = parts[i].translate(_kkhw_to_kkfw_trmap)
+    for i in range(1, len(parts), 2):
+        parts[i] = _kkhw_voiced_to_kkfw[parts[i]]
+    return "".join(parts)
 
 
 def ascii_fullwidth_to_halfwidth(text):
@@ -211,25 +341,286 @@ def ascii_halfwidth_to_fullwidth(text):
     return text.translate(_asciihw_to_asciifw_trmap)
 
 
+_jptext_re = re.compile("[{}]+".format(jptext.re_range))
+_jptext_nosym_re = re.compile("[{}]+".format(jptext.re_range_nosym))
+
+
 def jptext_portions(text, punctuation=False):
     if punctuation:
-        re_range = jptext.re_range
-    else:
-        re_range = jptext.re_range_nosym
-    rexp = re.compile('[{}]+'.format(re_range))
-    return rexp.findall(text)
+        return _jptext_re.findall(text)
+    return _jptext_nosym_re.findall(text)
 
-def is_charset(charset, text, punctuation=True):
+
+@functools.lru_cache(maxsize=None)
+def _charset_re(charset, punctuation):
     if punctuation:
-        re_range = charset.re_range + '\s'
+        re_range = charset.re_range + r"\s"
     else:
         re_range = charset.re_range_nosym
-    rexp = re.compile('^[{}]*$'.format(re_range))
-    return bool(rexp.match(text))
+    return re.compile("^[{}]*$".format(re_range))
+
+
+def is_charset(charset, text, punctuation=True):
+    return bool(_charset_re(charset, punctuation).match(text))
+
 
 def is_hiragana(text, punctuation=True):
     return is_charset(hiragana, text, punctuation)
 
+
 def is_katakana(text, punctuation=True):
     return is_charset(katakana, text, punctuation)
 
+
+def is_kanji(text, punctuation=True):
+    return is_charset(kanji, text, punctuation)
+
+
+def is_jptext(text, punctuation=True):
+    return is_charset(jptext, text, punctuation)
+
+
+# Character classes for splitting text into morae
+_MORA_LARGE = 1
+_MORA_COMBINING = 2
+_MORA_SOKUON = 3
+_MORA_STRESS = 4
+_MORA_LONG = 5
+
+
+def _build_mora_table():
+    table = {}
+    for cs in (hiragana, katakana, katakana_halfwidth):
+        for chars, cls in (
+            (cs.large + cs.small_non_combining + cs.ligatures + cs.repeats, _MORA_LARGE),
+            (cs.combining, _MORA_COMBINING),
+            (cs.sokuon, _MORA_SOKUON),
+            (cs.stresses, _MORA_STRESS),
+        ):
+            for c in chars:
+                table[c] = cls
+    table["\u3099"] = table["\u309a"] = _MORA_STRESS
+    table["ー"] = table["ｰ"] = _MORA_LONG
+    return table
+
+
+_mora_table = _build_mora_table()
+
+
+def _mora_spans(text):
+    # A mora is a large kana (optionally followed by a stress mark and/or a
+    # combining small kana), or a sokuon, "ー" or small kana on its own.
+    # Anything which isn't kana is skipped.
+    start = None
+    extendable = 0  # 2: can still take a stress mark or combining kana, 1: combining kana only, 0: neither
+    for i, c in enumerate(text):
+        cls = _mora_table.get(c)
+        if cls is None:
+            if start is not None:
+                yield start, i
+                start = None
+            extendable = 0
+            continue
+        if cls == _MORA_STRESS and extendable == 2:
+            extendable = 1
+            continue
+        if cls == _MORA_COMBINING and extendable:
+            extendable = 0
+            continue
+        if start is not None:
+            yield start, i
+            start = None
+        if cls == _MORA_STRESS:
+            # A stress mark with nothing to attach to isn't a mora
+            extendable = 0
+            continue
+        start = i
+        extendable = 2 if cls == _MORA_LARGE else 0
+    if start is not None:
+        yield start, len(text)
+
+
+def morae(text):
+    "Split kana (hiragana, katakana or halfwidth katakana) into a list of morae, ignoring anything else"
+    return [text[start:end] for start, end in _mora_spans(text)]
+
+
+def count_morae(text):
+    count = 0
+    for _ in _mora_spans(text):
+        count += 1
+    return count
+
+
+def count_morae_many(texts):
+    return [count_morae(text) for text in texts]
+
+
+# Collation (gojūon order)
+_GOJUON = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわゐゑをん"
+_GOJUON_VOWELS = "あいうえお" * 7 + "あうお" + "あいうえお" + "あいえお" + "ん"
+_COLLATE_OTHER = 1  # Primary weight marking a non-kana character (followed by its codepoint)
+_COLLATE_LONG = len(_GOJUON) + 2  # Primary weight of a "ー" with no kana before it
+_COLLATE_KANA, _COLLATE_LONG_MARK, _COLLATE_REPEAT = range(3)
+_collate_voicing_marks = {"\u3099": 1, "\u309a": 2, "゛": 1, "゜": 2, "ﾞ": 1, "ﾟ": 2}
+
+
+def _build_collation_table():
+    # char -> (kind, primary weight, voicing, size, script)
+    table = {}
+    for script, chars in ((1, hiragana.all), (2, katakana.all), (3, katakana_halfwidth.all)):
+        for c in chars:
+            if c in "ーｰ":
+                table[c] = (_COLLATE_LONG_MARK, _COLLATE_LONG, 0, 1, script)
+                continue
+            decomposed = unicodedata.normalize("NFD", katakana_halfwidth_to_fullwidth(c))
+            base = katakana_to_hiragana(decomposed[0])
+            voicing = _collate_voicing_marks.get(decomposed[1:], 0)
+            kind = _COLLATE_KANA
+            if base in "ゝゞ":
+                # Repeat marks take the weight of the kana before them (ゞ
+                # has already been decomposed into ゝ and a voicing mark)
+                kind = _COLLATE_REPEAT
+            size = 2
+            if base in hiragana.small:
+                base = unicodedata.lookup(unicodedata.name(base).replace("SMALL ", ""))
+                size = 0
+            if kind == _COLLATE_KANA and base not in _GOJUON:
+                continue
+            weight = _GOJUON.index(base) + 2 if kind == _COLLATE_KANA else _COLLATE_LONG
+            table[c] = (kind, weight, voicing, size, script)
+    return table
+
+
+_collation_table = _build_collation_table()
+# Primary weight -> the weight of its vowel (for "ー")
+_collate_vowels = {i + 2: _GOJUON.index(v) + 2 for i, v in enumerate(_GOJUON_VOWELS)}
+
+
+def collation_key(text):
+    """
+    Return a key (as bytes) for sorting kana in dictionary (gojūon) order,
+    e.g. sorted(words, key=collation_key).  Hiragana, katakana and halfwidth
+    katakana are ordered primarily by their plain sound (so が sorts with か,
+    っ with つ, and "ー" as a repeat of the previous vowel), then by
+    voicing/size, and lastly by script.  Anything which isn't kana sorts
+    before kana, in codepoint order.
+    """
+    primary = bytearray()
+    secondary = bytearray()
+    tertiary = bytearray()
+    prev_weight = None
+    i = 0
+    length = len(text)
+    while i < length:
+        c = text[i]
+        info = _collation_table.get(c)
+        i += 1
+        if info is None:
+            # Codepoint as three base-255 digits, avoiding zero bytes (which
+            # separate the levels)
+            cp = ord(c)
+            primary.extend((_COLLATE_OTHER, cp // 65025 + 1, cp // 255 % 255 + 1, cp % 255 + 1))
+            secondary.append(1)
+            tertiary.append(1)
+            prev_weight = None
+            continue
+        kind, weight, voicing, size, script = info
+        if prev_weight is not None:
+            if kind == _COLLATE_LONG_MARK:
+                weight = _collate_vowels.get(prev_weight, prev_weight)
+            elif kind == _COLLATE_REPEAT:
+                weight = prev_weight
+        if i < length and text[i] in _collate_voicing_marks:
+            voicing = _collate_voicing_marks[text[i]]
+            i += 1
+        primary.append(weight)
+        secondary.append(1 + voicing * 3 + size)
+        tertiary.append(script)
+        prev_weight = weight
+    return bytes(primary) + b"\0" + bytes(secondary) + b"\0" + bytes(tertiary)
+
+
+class Normalizer(object):
+    """
+    Applies a sequence of the conversion functions above (e.g.
+    ascii_fullwidth_to_halfwidth, katakana_halfwidth_to_fullwidth,
+    katakana_to_hiragana) in a single pass, by combining them into one
+    translation table.  Halfwidth katakana with a (han)dakuten are composed
+    directly into the single fullwidth character (e.g. ｶﾞ -> ガ) if
+    katakana_halfwidth_to_fullwidth is one of the steps, but no other
+    Unicode normalization is done.  (If an earlier step makes halfwidth
+    katakana, the steps from katakana_halfwidth_to_fullwidth on are done in
+    a second pass, so that the results are still the same as applying the
+    steps one after another.)
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+        self._rest = None
+        steps = self.steps
+        for i, step in enumerate(steps):
+            if step is katakana_halfwidth_to_fullwidth and katakana_fullwidth_to_halfwidth in steps[:i]:
+                # The halfwidth kana made by the earlier step could combine
+                # with (han)dakuten which are next to them in the text
+                self._rest = Normalizer(steps[i:])
+                steps = steps[:i]
+                break
+        tables = []
+        for step in steps:
+            if step not in _normalizer_tables:
+                raise ValueError("Unsupported normalization step: {!r}".format(step))
+            tables.append((step, _normalizer_tables[step]))
+
+        def apply(text):
+            for step, table in tables:
+                if step is katakana_halfwidth_to_fullwidth and text in _kkhw_voiced_to_kkfw:
+                    text = _kkhw_voiced_to_kkfw[text]
+                else:
+                    text = text.translate(table)
+            return text
+
+        chars = set()
+        for step, table in tables:
+            chars.update(table)
+        self.table = {}
+        for cp in chars:
+            result = apply(chr(cp))
+            if result != chr(cp):
+                self.table[cp] = result
+        self.voiced = None
+        if katakana_halfwidth_to_fullwidth in steps:
+            self.voiced = {pair: apply(pair) for pair in _kkhw_voiced_to_kkfw}
+
+    def normalize(self, text):
+        text = self._translate(text)
+        if self._rest is not None:
+            text = self._rest.normalize(text)
+        return text
+
+    def _translate(self, text):
+        if self.voiced is None:
+            return text.translate(self.table)
+        parts = _kkhw_voiced_re.split(text)
+        if len(parts) == 1:
+            return text.translate(self.table)
+        # split() puts the voiced pairs at the odd indexes
+        for i in range(0, len(parts), 2):
+            parts[i] = parts[i].translate(self.table)
+        for i in range(1, len(parts), 2):
+            parts[i] = self.voiced[parts[i]]
+        return "".join(parts)
+
+    def normalize_many(self, texts):
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
+
+
+_normalizer_tables = {
+    hiragana_to_katakana: _hiragana_to_katakana_trmap,
+    katakana_to_hiragana: _katakana_to_hiragana_trmap,
+    katakana_halfwidth_to_fullwidth: _kkhw_to_kkfw_trmap,
+    katakana_fullwidth_to_halfwidth: _kkfw_to_kkhw_voiced_trmap,
+    ascii_fullwidth_to_halfwidth: _asciifw_to_asciihw_trmap,
+    ascii_halfwidth_to_fullwidth: _asciihw_to_asciifw_trmap,
+}
@@ -0,0 +1,174 @@
+"""
+Command-line tool for converting large amounts of line-oriented text (width
+folding, kana folding and/or romanization), spread over multiple processes.
+"""
+
+import argparse
+import collections
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+from . import charset
+from . import romaji
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_converter = None  # Set in each worker process by _init_worker()
+
+
+def build_converter(fold_width=False, fold_kana=None, to_romaji=False, macron=None):
+    """
+    Return a function which applies the chosen conversions (in the order
+    width folding, kana folding, romanization) to a block of text.
+    `fold_kana` can be "hiragana" or "katakana".
+    """
+    steps = []
+    if fold_width:
+        steps.extend([charset.ascii_fullwidth_to_halfwidth, charset.katakana_halfwidth_to_fullwidth])
+    if fold_kana == "hiragana":
+        steps.append(charset.katakana_to_hiragana)
+    elif fold_kana == "katakana":
+        steps.append(charset.hiragana_to_katakana)
+    elif fold_kana is not None:
+        raise ValueError("Unknown kana folding: {!r}".format(fold_kana))
+    normalizer = charset.Normalizer(steps) if steps else None
+
+    def convert(block):
+        if normalizer:
+            block = normalizer.normalize(block)
+        if to_romaji:
+            # Each line is converted separately, so that the results don't
+            # depend on where the blocks happen to be split
+            block = "\n".join(romaji.kana_to_romaji_many(block.split("\n"), macron=macron))
+        return block
+
+    return convert
+
+
+def read_blocks(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    "Read a text file in blocks of about `chunk_size` characters, each ending at the end of a line"
+    carry = ""
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        end = data.rfind("\n") + 1
+        if end:
+            yield carry + data[:end]
+            carry = data[end:]
+        else:
+            carry += data
+    if carry:
+        yield carry
+
+
+def _init_worker(options):
+    global _converter
+    _converter = build_converter(**options)
+
+
+def _convert_block(block):
+    return _converter(block)
+
+
+def imap_bounded(pool, func, items, window):
+    """
+    Like pool.imap(), but only takes another item from `items` when fewer
+    than `window` are being worked on or waiting to be collected, so that a
+    large input isn't read into memory faster than it can be processed.
+    """
+    pending = collections.deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def _open_input(filename):
+    if filename == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    return open(filename, "r", encoding="utf-8", newline="")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="jptext", description=__doc__.strip())
+    parser.add_argument("files", nargs="*", default=["-"], help="Input files (default: stdin)")
+    parser.add_argument("--output", "-o", metavar="FILE", help="Write to this file (default: stdout)")
+    parser.add_argument(
+        "--fold-width",
+        action="store_true",
+        help="Convert fullwidth ASCII to halfwidth, and halfwidth katakana to fullwidth",
+    )
+    parser.add_argument("--fold-kana", choices=("hiragana", "katakana"), help="Convert all kana to one script")
+    parser.add_argument("--romaji", action="store_true", help="Convert kana to romaji")
+    parser.add_argument("--macron", action="store_true", help="Use macrons for long vowels in romaji")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Approximate number of characters per block of work (default: %(default)s)",
+    )
+    parser.add_argument("--stats", action="store_true", help="Report throughput on stderr when done")
+    args = parser.parse_args(argv)
+
+    options = {
+        "fold_width": args.fold_width,
+        "fold_kana": args.fold_kana,
+        "to_romaji": args.romaji,
+        "macron": "̄" if args.macron else None,
+    }
+    if args.output:
+        out = open(args.output, "w", encoding="utf-8", newline="")
+    else:
+        out = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+
+    pool = None
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, initializer=_init_worker, initargs=(options,))
+    else:
+        _init_worker(options)
+    chars = 0
+    lines = 0
+    start = time.perf_counter()
+    try:
+        for filename in args.files:
+            f = _open_input(filename)
+            try:
+                blocks = read_blocks(f, args.chunk_size)
+                if pool:
+                    results = imap_bounded(pool, _convert_block, blocks, 2 * args.jobs)
+                else:
+                    results = map(_convert_block, blocks)
+                for block in results:
+                    out.write(block)
+                    chars += len(block)
+                    lines += block.count("\n")
+            finally:
+                # (Closing the wrapper around stdin would close stdin too)
+                if filename == "-":
+                    f.detach()
+                else:
+                    f.close()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        out.flush()
+        if args.output:
+            out.close()
+        else:
+            out.detach()
+    elapsed = time.perf_counter() - start
+
+    if args.stats:
+        sys.stderr.write(
+            "{} lines, {} characters in {:.2f}s ({:.0f} lines/sec, {:.0f} characters/sec)\n".format(
+                lines, chars, elapsed, lines / elapsed if elapsed else 0, chars / elapsed if elapsed else 0
+            )
+        )
@@ -382,16 +382,11 @@ def conj_verb(word, form, verb_type=None, jmdict=None):
             if not jmdict:
                 jmdict = jmd._default_jmdict()
             try:
-                entries = jmdict.lookup(word)
+                # (This is looked up in an index which JMDict builds once, so
+                # generating lots of forms doesn't mean lots of dictionary scans)
+                verb_type = jmdict.verb_type(word)
             except KeyError:
                 raise ValueError("The word {!r} is unknown.  Cannot determine verb type.".format(word)) from None
-            for e in entries:
-                for p in e.pos_details:
-                    if p['cat'] == 'verb':
-                        verb_type = p['subcat']
-                        break
-                if verb_type:
-                    break
             if not verb_type:
                 raise ValueError("The word {!r} is not a verb or its type cannot be determined.".format(word))
 
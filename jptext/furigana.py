@@ -1,18 +1,75 @@
 import html
+import json
+import multiprocessing
 import re
 from . import charset
+from .cache import LRUCache
+from . import jmdict as jmd
 from . import kanjidic
 
 hiragana_re = re.compile("[^" + charset.kanji.re_range_nosym + charset.katakana.re_range_nosym + "]+")
+kanji_char_re = re.compile("[" + charset.kanji.re_range_nosym + "]")
+kanji_re = re.compile("[" + charset.kanji.re_range_nosym + charset.katakana.re_range_nosym + "]+")
+non_hiragana_re = re.compile("[^" + charset.hiragana.re_range_nosym + "]")
+
+
+# Flags for the kinds of derived readings produced by expand_readings()
+READING_OKURIGANA_STEM = 1  # Kun reading with its okurigana removed (た.べる -> た)
+READING_RENDAKU = 2  # Initial kana voiced (ひと -> びと, ほん -> ぼん/ぽん)
+READING_SOKUON = 4  # Final つ/ち/く/き geminated (がく -> がっ)
+
+# fmt: off
+_rendaku_map = {
+    "か": "が", "き": "ぎ", "く": "ぐ", "け": "げ", "こ": "ご",
+    "さ": "ざ", "し": "じ", "す": "ず", "せ": "ぜ", "そ": "ぞ",
+    "た": "だ", "ち": "ぢ", "つ": "づ", "て": "で", "と": "ど",
+    "は": "ばぱ", "ひ": "びぴ", "ふ": "ぶぷ", "へ": "べぺ", "ほ": "ぼぽ",
+}
+# fmt: on
+_geminating_kana = "つちくき"
 
 
 class FuriganaError(Exception):
     pass
 
 
+# Kinds of alignment done by match_furi() (see its `outcomes` argument)
+MATCH_EXACT = "exact"  # Every kanji matched one of its readings
+MATCH_WILDCARD = "wildcard"  # All but one kanji matched one of its readings
+MATCH_GROUP = "group"  # No per-kanji alignment found; furigana is for the whole group
+
+# Compiled get_furi_re() patterns, keyed by furi_skeleton()
+pattern_cache = LRUCache(1024)
+# match_furi() results, keyed by (kanji, furigana)
+alignment_cache = LRUCache(16384)
+# The kanjidic the alignments in alignment_cache were worked out with (the
+# cache is cleared if the default kanjidic is replaced)
+_alignment_kanjidict = None
+
+
+def clear_caches():
+    "Discard all cached patterns, readings and alignments (and reset the cache statistics)"
+    pattern_cache.clear()
+    alignment_cache.clear()
+    _reading_cache.clear()
+
+
+def furi_skeleton(kanji_text):
+    # Everything get_furi_re() cares about: the kana, and where the runs of
+    # kanji are (but not which kanji they are)
+    return kanji_re.sub("\0", kanji_text)
+
+
 def get_furi_re(kanji_text):
-    global hiragana_re
+    skeleton = furi_skeleton(kanji_text)
+    furi_re = pattern_cache.get(skeleton)
+    if furi_re is None:
+        furi_re = _compile_furi_re(kanji_text)
+        pattern_cache.put(skeleton, furi_re)
+    return furi_re
+
 
+def _compile_furi_re(kanji_text):
     pattern = []
     pos = 0
     while pos < len(kanji_text):
@@ -24,7 +81,7 @@ def get_furi_re(kanji_text):
             pattern.append("()")
         else:
             pattern.append("(.+)")
-        pattern.append("(" + m.group() + ")")
+        pattern.append("(" + re.escape(m.group()) + ")")
         pos = m.end()
     return re.compile("".join(pattern))
 
@@ -37,7 +94,7 @@ def pairwise(seq):
 
 def cleanup_reading(text):
     text = charset.katakana_to_hiragana(text)
-    text = re.sub("[^" + charset.hiragana.re_range_nosym + "]", "", text)
+    text = non_hiragana_re.sub("", text)
     return text
 
 
@@ -49,36 +106,219 @@ def get_readings(kanji_char):
     return set((cleanup_reading(r) for r in kde.all_readings))
 
 
-def match_furi(kanji, furi):
-    # Construct a regular expression pattern of all possible ways to read this
-    # sequence of kanji (based on individual kanji readings)
-    pattern = []
-    for char in kanji:
-        readings = get_readings(char)
-        if readings:
-            pattern.append("(" + "|".join((re.escape(r) for r in readings)) + ")")
-        else:
-            pattern.append("(.+)")
+def _flag_count(flags):
+    return bin(flags).count("1")
+
+
+def expand_readings(readings):
+    """
+    Given the raw kanjidic readings for a kanji, return a dict mapping each
+    (cleaned up) reading it might plausibly have in a word to a set of
+    READING_* flags describing how it was derived from the dictionary
+    readings (0 for the dictionary readings themselves).  Where the same
+    reading can be derived more than one way, the simplest derivation wins.
+    """
+    result = {}
+
+    def add(reading, flags):
+        if reading and (reading not in result or _flag_count(flags) < _flag_count(result[reading])):
+            result[reading] = flags
+
+    for raw in readings:
+        add(cleanup_reading(raw), 0)
+        if "." in raw:
+            add(cleanup_reading(raw.split(".", 1)[0]), READING_OKURIGANA_STEM)
+    for reading, flags in list(result.items()):
+        variants = [(reading, flags)]
+        for voiced in _rendaku_map.get(reading[0], ""):
+            variants.append((voiced + reading[1:], flags | READING_RENDAKU))
+        for variant, vflags in variants:
+            add(variant, vflags)
+            if len(variant) > 1 and variant[-1] in _geminating_kana:
+                add(variant[:-1] + charset.hiragana.sokuon, vflags | READING_SOKUON)
+    return result
+
+
+def get_expanded_readings(kanji_char):
+    "Return the expand_readings() dict for a kanji (empty if it is unknown)"
+    try:
+        kde = kanjidic.get_kanji(kanji_char)
+    except KeyError:
+        return {}
+    expanded = kde.furigana_readings
+    if expanded is None:
+        # Dictionary data generated before these were precomputed
+        expanded = expand_readings(kde.all_readings)
+    return dict(expanded)
+
+
+# kanji -> (KanjiDictEntry, readings) for kanji we have already looked up.  The
+# entry is kept so we notice if the default kanjidic has been replaced.
+_reading_cache = {}
+
+
+def _kanji_readings(kanji_char):
+    """
+    (reading, penalty) pairs for a kanji as a tuple, longest first.  The
+    penalty is the number of sound changes needed to get the reading from the
+    dictionary, and is used to rank alternative alignments.
+    """
+    try:
+        kde = kanjidic.get_kanji(kanji_char)
+    except KeyError:
+        return ()
+    cached = _reading_cache.get(kanji_char)
+    if cached is not None and cached[0] is kde:
+        return cached[1]
+    readings = ((r, _flag_count(f)) for r, f in get_expanded_readings(kanji_char).items())
+    readings = tuple(sorted(readings, key=lambda rp: (-len(rp[0]), rp[1], rp[0])))
+    _reading_cache[kanji_char] = (kde, readings)
+    return readings
+
 
-    # We try an exact match with the full expression first.  If that doesn't
-    # work, we go one level deeper and see if we can match all-but-one of the
-    # kanji, in which case, we'll use that.  This catches many common cases of
-    # rendaku, etc, though can theoretically result in incorrect assignments of
-    # things that really should be done as a group instead.
-    for i in range(-1, len(pattern)):
-        p = list(pattern)
-        if i >= 0:
-            p[i] = "(.+)"
-        m = re.match("".join(p) + "$", furi)
-        if m:
-            return [pair for pair in zip(kanji, m.groups())]
+def _best_costs(readings, furi, wildcards):
+    # Works backwards from the end of the strings, filling in the cost (total
+    # reading penalty) of the cheapest way of matching kanji[i:] to furi[j:]
+    # with `wildcards` unmatched kanji still allowed (None if it cannot be
+    # done).  Alongside each row we keep a suffix-minimum over j, so that "any
+    # reading of length 1+" (a wildcard) can be checked in constant time
+    # instead of trying every length.
+    n = len(readings)
+    m = len(furi)
+    costs = [None] * (n + 1)
+    suffix_best = [None] * (n + 1)
+    row = [[None] * (m + 1) for w in range(wildcards + 1)]
+    for w in range(wildcards + 1):
+        row[w][m] = 0
+    costs[n] = row
+    suffix_best[n] = [_suffix_min(r) for r in row]
+    for i in range(n - 1, -1, -1):
+        k_readings = readings[i]
+        next_row = costs[i + 1]
+        next_best = suffix_best[i + 1]
+        row = [[None] * (m + 1) for w in range(wildcards + 1)]
+        for w in range(wildcards + 1):
+            for j in range(m):
+                best = None
+                if not k_readings:
+                    # Kanji we know nothing about can match anything, and
+                    # do not count against the wildcard limit.
+                    if next_best[w][j + 1] is not None:
+                        best = next_best[w][j + 1][0]
+                else:
+                    if w and next_best[w - 1][j + 1] is not None:
+                        best = next_best[w - 1][j + 1][0]
+                    for reading, penalty in k_readings:
+                        if furi.startswith(reading, j):
+                            c = next_row[w][j + len(reading)]
+                            if c is not None and (best is None or c + penalty < best):
+                                best = c + penalty
+                row[w][j] = best
+        costs[i] = row
+        suffix_best[i] = [_suffix_min(r) for r in row]
+    return costs, suffix_best
+
+
+def _suffix_min(row):
+    # result[j] = (min cost, largest position with that cost) over row[j:]
+    result = [None] * (len(row) + 1)
+    best = None
+    for j in range(len(row) - 1, -1, -1):
+        c = row[j]
+        if c is not None and (best is None or c < best[0]):
+            best = (c, j)
+        result[j] = best
+    return result
+
+
+def _align(kanji, furi, readings, costs, suffix_best, wildcards):
+    # Walk forwards again choosing, at each step, the first option (in order
+    # of preference) which still achieves the best possible cost.  Wildcards
+    # are greedy and are used as early as possible, mirroring the behaviour
+    # of the old regular-expression based matching.
+    result = []
+    j = 0
+    w = wildcards
+    for i, k_readings in enumerate(readings):
+        target = costs[i][w][j]
+        if not k_readings or w:
+            nw = w if not k_readings else w - 1
+            best = suffix_best[i + 1][nw][j + 1]
+            if best is not None and best[0] == target:
+                result.append((kanji[i], furi[j:best[1]]))
+                j = best[1]
+                w = nw
+                continue
+        for reading, penalty in k_readings:
+            if furi.startswith(reading, j) and costs[i + 1][w][j + len(reading)] == target - penalty:
+                result.append((kanji[i], reading))
+                j += len(reading)
+                break
+    return result
+
+
+def match_furi(kanji, furi, outcomes=None):
+    # If `outcomes` is given, the MATCH_* kind of alignment that was done is
+    # appended to it (this is mainly useful for testing/tuning).
+    global _alignment_kanjidict
+    kd = kanjidic._default_kanjidict()
+    if kd is not _alignment_kanjidict:
+        alignment_cache.clear()
+        _alignment_kanjidict = kd
+    key = (kanji, furi)
+    cached = alignment_cache.get(key)
+    if cached is None:
+        cached = _match_furi(kanji, furi)
+        alignment_cache.put(key, cached)
+    result, outcome = cached
+    if outcomes is not None:
+        outcomes.append(outcome)
+    return list(result)
+
+
+def _match_furi(kanji, furi):
+    # Find the best way to split the furigana between the individual kanji,
+    # based on the known readings of each one (including common sound changes,
+    # though the plain dictionary readings are preferred where possible).  We
+    # try for an exact match first.  If that doesn't work, we go one level
+    # deeper and see if we can match all-but-one of the kanji, in which case,
+    # we'll use that.  This catches many of the less common sound changes,
+    # etc, though can theoretically result in incorrect assignments of things
+    # that really should be done as a group instead.
+    readings = [_kanji_readings(char) for char in kanji]
+    costs, suffix_best = _best_costs(readings, furi, 1)
+    for wildcards, outcome in ((0, MATCH_EXACT), (1, MATCH_WILDCARD)):
+        if costs[0][wildcards][0] is not None:
+            return (tuple(_align(kanji, furi, readings, costs, suffix_best, wildcards)), outcome)
 
     # Couldn't figure out how to match them up to individual characters at all.
     # Give up and just return it as a group.
-    return [(kanji, furi)]
+    return (((kanji, furi),), MATCH_GROUP)
+
 
+def apply_furi(kanji_text, hiragana_text, jmdict=None):
+    # Words in JMdict have their alignments worked out ahead of time, so
+    # check there before doing it the hard way.
+    if not jmdict:
+        jmdict = _optional_jmdict()
+    if jmdict:
+        try:
+            return jmdict.lookup_furigana(kanji_text, hiragana_text)
+        except KeyError:
+            pass
+    return align_furi(kanji_text, hiragana_text)
 
-def apply_furi(kanji_text, hiragana_text):
+
+def _optional_jmdict():
+    # The precomputed alignments are only a shortcut, so if the JMdict data
+    # hasn't been generated we can still manage with just kanjidic.
+    try:
+        return jmd._default_jmdict()
+    except ImportError:
+        return None
+
+
+def align_furi(kanji_text, hiragana_text, outcomes=None):
     furi_re = get_furi_re(kanji_text)
     m = furi_re.match(hiragana_text)
     if not m:
@@ -90,19 +330,239 @@ def apply_furi(kanji_text, hiragana_text):
             k_end = kanji_text.index(hira, k_start)
             k_seq = kanji_text[k_start:k_end]
             if k_seq:
-                result.extend(match_furi(k_seq, furi))
+                result.extend(match_furi(k_seq, furi, outcomes))
             result.append((hira, None))
             k_start = k_end + len(hira)
         else:
             # This will only happen at the end of the string
             k_seq = kanji_text[k_start:]
-            result.extend(match_furi(k_seq, furi))
+            result.extend(match_furi(k_seq, furi, outcomes))
     return result
 
 
+_pool_jmdict = None
+
+
+def _apply_furi_pair(pair):
+    return apply_furi(pair[0], pair[1], jmdict=_pool_jmdict)
+
+
+def apply_furi_many(pairs, workers=None, jmdict=None, chunksize=64):
+    """
+    Run apply_furi() over an iterable of (kanji_text, hiragana_text) pairs,
+    returning a list of the results in the same order.  Repeated pairs are
+    only aligned once.  If `workers` is given, the work is spread over a pool
+    of that many processes.  (Where possible, the pool is forked after the
+    dictionaries have been loaded, so the workers share them instead of
+    loading their own copies.)
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    unique = list(dict.fromkeys(pairs))
+    if not workers or workers == 1:
+        results = {pair: apply_furi(pair[0], pair[1], jmdict=jmdict) for pair in unique}
+    else:
+        global _pool_jmdict
+        _pool_jmdict = jmdict or _optional_jmdict()
+        kanjidic._default_kanjidict()
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            context = multiprocessing.get_context()
+        try:
+            with context.Pool(workers) as pool:
+                results = dict(zip(unique, pool.imap(_apply_furi_pair, unique, chunksize)))
+        finally:
+            _pool_jmdict = None
+    return [list(results[pair]) for pair in pairs]
+
+
+def infer_furi(text, jmdict=None):
+    """
+    Work out furigana for plain Japanese text, without being given a reading.
+    `text` may be a string, or an iterable of strings (such as an open file)
+    which is processed a chunk at a time.  Yields (text, furigana) segments in
+    the same form as apply_furi() (with None for text that has no furigana).
+
+    Words are found by looking for the longest dictionary word (or verb or
+    adjective stem) starting at each kanji, and each is given its most common
+    reading.  Kanji which do not start any known word get no furigana.
+    """
+    if not jmdict:
+        jmdict = jmd._default_jmdict()
+    plain = []  # Text with no furigana which has not been yielded yet
+    for segment in _scan_words(text, jmdict):
+        if segment[1] is None:
+            plain.append(segment[0])
+        else:
+            if plain:
+                plain = "".join(plain)
+                if plain:
+                    yield (plain, None)
+                plain = []
+            yield segment
+    plain = "".join(plain)
+    if plain:
+        yield (plain, None)
+
+
+def _scan_words(text, jmdict):
+    # Yields the segments for infer_furi(), without joining up the pieces of
+    # text which have no furigana
+    if isinstance(text, str):
+        text = (text,)
+    max_len = jmdict.max_surface_length()
+    chunks = iter(text)
+    buf = ""
+    final = False
+    while not final:
+        try:
+            buf += next(chunks)
+        except StopIteration:
+            final = True
+        # A word starting too close to the end of what we have so far might
+        # continue into the next chunk, so those have to wait.
+        limit = len(buf) if final else len(buf) - max_len
+        pos = 0
+        while pos < limit:
+            m = kanji_char_re.search(buf, pos, limit)
+            if not m:
+                yield (buf[pos:limit], None)
+                pos = limit
+                break
+            start = m.start()
+            yield (buf[pos:start], None)
+            word = _longest_word(buf, start, jmdict)
+            if word is None:
+                yield (buf[start], None)
+                pos = start + 1
+                continue
+            yield from _word_furi(word[0], word[1], jmdict)
+            pos = start + len(word[0])
+        buf = buf[pos:]
+
+
+def _longest_word(text, start, jmdict):
+    for length in jmdict.surface_lengths(text[start]):
+        surface = text[start : start + length]
+        if len(surface) == length:
+            try:
+                return (surface, jmdict.best_reading(surface))
+            except KeyError:
+                pass
+    return None
+
+
+def _word_furi(surface, reading, jmdict):
+    try:
+        return apply_furi(surface, reading, jmdict=jmdict)
+    except FuriganaError:
+        # (Usually a reading given in katakana)
+        return [(surface, reading)]
+
+
+def infer_furi_lines(text, jmdict=None):
+    "Like infer_furi(), but yields a list of segments for each line of the text (without the line endings)"
+    line = []
+    for segment, furi in infer_furi(text, jmdict=jmdict):
+        if furi is None and "\n" in segment:
+            parts = segment.split("\n")
+            if parts[0]:
+                line.append((parts[0], None))
+            yield line
+            for part in parts[1:-1]:
+                yield [(part, None)] if part else []
+            line = [(parts[-1], None)] if parts[-1] else []
+        else:
+            line.append((segment, furi))
+    if line:
+        yield line
+
+
+def write_inferred_furi(text, out, renderer=None, jmdict=None):
+    "Like write_furi(), but for plain text which has no reading supplied (see infer_furi())"
+    if renderer is None:
+        renderer = _html_renderer
+    renderer.write(infer_furi_lines(text, jmdict=jmdict), out)
+
+
+class FuriganaRenderer(object):
+    """
+    Base class for things which turn the segments returned by apply_furi()
+    into marked-up text.  Subclasses implement render(), which yields the
+    output for one line a piece at a time.  render_lines() and write() then
+    stream whole documents (iterables of lines of segments) without ever
+    building the complete output in memory.
+    """
+
+    line_separator = "\n"
+
+    def render(self, segments):
+        raise NotImplementedError
+
+    def render_lines(self, lines):
+        for segments in lines:
+            yield "".join(self.render(segments))
+            yield self.line_separator
+
+    def write(self, lines, out):
+        write = out.write
+        for text in self.render_lines(lines):
+            write(text)
+
+
+class HTMLRubyRenderer(FuriganaRenderer):
+    "<ruby><rb>漢</rb><rt>かん</rt><rb>字</rb><rt>じ</rt></ruby>"
+
+    def render(self, segments):
+        yield "<ruby>"
+        for kanji, furi in segments:
+            yield "<rb>{}</rb><rt>{}</rt>".format(html.escape(kanji), html.escape(furi or ""))
+        yield "</ruby>"
+
+
+class AnkiRenderer(FuriganaRenderer):
+    "漢[かん] 字[じ] (the format used by Anki's furigana fields)"
+
+    def render(self, segments):
+        first = True
+        for kanji, furi in segments:
+            if furi is None:
+                yield kanji
+            else:
+                # Anki takes everything up to the previous space as the base
+                # text for the reading, so each one needs to be separated.
+                if not first:
+                    yield " "
+                yield "{}[{}]".format(kanji, furi)
+            first = False
+
+
+class JSONLinesRenderer(FuriganaRenderer):
+    "One JSON list of [text, furigana-or-null] pairs per line"
+
+    def render(self, segments):
+        yield json.dumps([[kanji, furi] for kanji, furi in segments], ensure_ascii=False)
+
+
+def furi_lines(pairs, jmdict=None):
+    "Lazily apply_furi() each of an iterable of (kanji_text, hiragana_text) pairs"
+    for kanji_text, hiragana_text in pairs:
+        yield apply_furi(kanji_text, hiragana_text, jmdict=jmdict)
+
+
+def write_furi(pairs, out, renderer=None, jmdict=None):
+    """
+    Render furigana for each (kanji_text, hiragana_text) pair, writing the
+    results to the file-like object `out` one line at a time (using an
+    HTMLRubyRenderer if no renderer is given).
+    """
+    if renderer is None:
+        renderer = _html_renderer
+    renderer.write(furi_lines(pairs, jmdict=jmdict), out)
+
+
+_html_renderer = HTMLRubyRenderer()
+
+
 def furi_html(kanji_text, hiragana_text):
-    result = ["<ruby>"]
-    for kanji, furi in apply_furi(kanji_text, hiragana_text):
-        result.append("<rb>{}</rb><rt>{}</rt>".format(html.escape(kanji), html.escape(furi or "")))
-    result.append("</ruby>")
-    return "".join(result)
+    return "".join(_html_renderer.render(apply_furi(kanji_text, hiragana_text)))
@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import bisect
+from . import charset
+from . import romaji
 
 
 class JMDict(object):
-    def __init__(self, data=None):
+    def __init__(self, data=None, furigana=None):
         if data is None:
             from . import _jmdict_data
 
             data = _jmdict_data.entries
+            if furigana is None:
+                # (Not present in data generated by older versions)
+                furigana = getattr(_jmdict_data, "furigana", None)
         self._data = data
+        self._furigana = furigana or {}
+        self._reading_index = None
+        self._romaji_index = None
+        self._sorted_readings = None
+        self._verb_types = None
         self.reindex()
 
     def reindex(self):
@@ -22,6 +33,10 @@ class JMDict(object):
                 kana_index.setdefault(r["reb"], []).append(entry)
         self._kanji_index = kanji_index
         self._kana_index = kana_index
+        self._reading_index = None
+        self._romaji_index = None
+        self._sorted_readings = None
+        self._verb_types = None
 
     def lookup_kanji(self, kanji):
         return [JMDictEntry(entry) for entry in self._kanji_index[kanji]]
@@ -36,6 +51,185 @@ class JMDict(object):
             pass
         return self.lookup_kana(word)
 
+    def lookup_romaji(self, text):
+        """
+        Look up words by their reading, given in romaji.  The query and the
+        readings are both normalized with romaji.search_key(), so the
+        different ways of romanizing the same reading all match (e.g. tōkyō,
+        toukyou or tokyo).  Raises KeyError if nothing matches.
+        """
+        return [JMDictEntry(entry) for entry in self._get_romaji_index()[0][romaji.search_key(text)]]
+
+    def lookup_romaji_prefix(self, text, limit=None):
+        "Like lookup_romaji(), but for words whose reading starts with the given romaji"
+        index, keys = self._get_romaji_index()
+        prefix = romaji.search_key(text)
+        result = []
+        seen = set()
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            for entry in index[keys[i]]:
+                if id(entry) not in seen:
+                    seen.add(id(entry))
+                    result.append(JMDictEntry(entry))
+                    if limit is not None and len(result) >= limit:
+                        return result
+        return result
+
+    def _get_romaji_index(self):
+        if self._romaji_index is None:
+            index = {}
+            for entry in self._data:
+                for r in entry["r_ele"]:
+                    # The keys are precomputed by the generator (but not in
+                    # data generated by older versions)
+                    key = r.get("romaji")
+                    if key is None:
+                        key = romaji.search_key(r["reb"])
+                    entries = index.setdefault(key, [])
+                    if not entries or entries[-1] is not entry:
+                        entries.append(entry)
+            self._romaji_index = (index, sorted(index))
+        return self._romaji_index
+
+    def sorted_readings(self):
+        """
+        Return a list of (reading, JMDictEntry) for every reading in the
+        dictionary, in gojūon order (see charset.collation_key()).
+        """
+        if self._sorted_readings is None:
+            readings = []
+            for entry in self._data:
+                for r in entry["r_ele"]:
+                    # The keys are precomputed by the generator (but not in
+                    # data generated by older versions)
+                    key = r.get("collation_key")
+                    if key is None:
+                        key = charset.collation_key(r["reb"])
+                    readings.append((key, r["reb"], entry))
+            readings.sort(key=lambda r: r[:2])
+            self._sorted_readings = [(reb, entry) for key, reb, entry in readings]
+        return [(reb, JMDictEntry(entry)) for reb, entry in self._sorted_readings]
+
+    def verb_type(self, word):
+        """
+        Return the verb type (the "subcat" of its verb pos_details, e.g.
+        "godan") of the first entry lookup(word) returns which is a verb, or
+        None if none of them are.  Raises KeyError if the word is not known.
+        """
+        if self._verb_types is None:
+            self._verb_types = self._build_verb_types()
+        verb_type = self._verb_types.get(word)
+        if verb_type is None and word not in self._kanji_index and word not in self._kana_index:
+            raise KeyError(word)
+        return verb_type
+
+    def _build_verb_types(self):
+        entry_types = {}
+        for entry in self._data:
+            for sense in entry["sense"]:
+                pd = next((pd for pd in sense["pos_details"] if pd["cat"] == "verb"), None)
+                if pd is not None:
+                    if pd["subcat"]:
+                        entry_types[id(entry)] = pd["subcat"]
+                    break
+        result = {}
+        # Kanji forms take precedence, as in lookup()
+        for index in (self._kana_index, self._kanji_index):
+            for word, entries in index.items():
+                verb_type = next((entry_types[id(e)] for e in entries if id(e) in entry_types), None)
+                if verb_type:
+                    result[word] = verb_type
+                else:
+                    result.pop(word, None)
+        return result
+
+    def lookup_furigana(self, kanji, kana):
+        """
+        Return the precomputed furigana alignment for the given kanji and kana
+        forms of a word, in the same format as furigana.apply_furi().  Raises
+        KeyError if this is not a known pairing.
+        """
+        # The table stores alternating (kanji length, reading length) pairs
+        # for each segment, with a reading length of 0 meaning the segment
+        # is kana which has no furigana.
+        lengths = self._furigana[(kanji, kana)]
+        result = []
+        k_pos = 0
+        r_pos = 0
+        for k_len, r_len in zip(lengths[::2], lengths[1::2]):
+            text = kanji[k_pos : k_pos + k_len]
+            if r_len:
+                result.append((text, kana[r_pos : r_pos + r_len]))
+            else:
+                r_len = k_len
+                result.append((text, None))
+            k_pos += k_len
+            r_pos += r_len
+        return result
+
+    def kanji_reading_pairs(self):
+        "Yield every (kanji form, reading) pair in the dictionary, taking re_restr and re_nokanji into account"
+        for entry in self._data:
+            for k in entry["k_ele"]:
+                keb = k["keb"]
+                for r in entry["r_ele"]:
+                    if r.get("re_nokanji") or keb not in r.get("re_restr", (keb,)):
+                        continue
+                    yield (keb, r["reb"])
+
+    def best_reading(self, surface):
+        """
+        Return the most likely reading for a word as it appears in text, based
+        on the priority information for its kanji and kana forms.  `surface`
+        can be a kanji form from the dictionary, or the stem (minus the last
+        kana) of a kanji form of a verb or i-adjective.  Raises KeyError if
+        `surface` is not known.
+        """
+        return self._get_reading_index()[0][surface][0]
+
+    def surface_lengths(self, first_char):
+        "Return the lengths (longest first) of the best_reading() surfaces which start with `first_char`"
+        return self._get_reading_index()[1].get(first_char, ())
+
+    def max_surface_length(self):
+        return self._get_reading_index()[2]
+
+    def _get_reading_index(self):
+        if self._reading_index is None:
+            self._reading_index = self._build_reading_index()
+        return self._reading_index
+
+    def _build_reading_index(self):
+        readings = {}
+        for entry in self._data:
+            inflects = any(
+                pd["cat"] == "verb" or (pd["cat"] == "adj" and pd["subcat"] == "i")
+                for sense in entry["sense"]
+                for pd in sense["pos_details"]
+            )
+            for k in entry["k_ele"]:
+                keb = k["keb"]
+                k_score = priority_score(k.get("ke_pri", ()))
+                for r in entry["r_ele"]:
+                    if r.get("re_nokanji") or keb not in r.get("re_restr", (keb,)):
+                        continue
+                    reb = r["reb"]
+                    score = k_score + priority_score(r.get("re_pri", ()))
+                    candidates = [(keb, reb)]
+                    if inflects and len(keb) > 1 and keb[-1] == reb[-1] and keb[-1] in charset.hiragana.all:
+                        # The stem, so we can recognize inflected forms
+                        candidates.append((keb[:-1], reb[:-1]))
+                    for surface, reading in candidates:
+                        if surface not in readings or score > readings[surface][1]:
+                            readings[surface] = (reading, score)
+        lengths = {}
+        for surface in readings:
+            lengths.setdefault(surface[0], set()).add(len(surface))
+        lengths = {c: tuple(sorted(ls, reverse=True)) for c, ls in lengths.items()}
+        return (readings, lengths, max((len(s) for s in readings), default=0))
+
     def entries(self):
         return (JMDictEntry(entry) for entry in self._data)
 
@@ -43,6 +237,25 @@ class JMDict(object):
         return "<{}: {} entries>".format(self.__class__.__name__, len(self._data))
 
 
+def priority_score(pri_tags):
+    """
+    Turn a list of JMdict ke_pri/re_pri tags into a single number, where
+    higher means the word (or the particular spelling/reading of it) is more
+    common.
+    """
+    score = 0.0
+    for tag in pri_tags:
+        if tag.startswith("nf"):
+            # Frequency-of-use ranking, in bands of 500 words (nf01 is the
+            # most common)
+            score += (49 - int(tag[2:])) / 48.0
+        elif tag.endswith("1"):
+            score += 2
+        elif tag.endswith("2"):
+            score += 1
+    return score
+
+
 class JMDictEntry(object):
     def __init__(self, data):
         self._data = data
@@ -128,3 +341,7 @@ def _default_jmdict():
 
 def lookup_kanji(kanji):
     return _default_jmdict().lookup_kanji(kanji)
+
+
+def lookup_romaji(text):
+    return _default_jmdict().lookup_romaji(text)
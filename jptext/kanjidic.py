@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import collections
+import multiprocessing
+import re
+from . import charset
+
+# Width of the buckets used for KanjiProfile.freq_band (a kanji with a
+# frequency rank of 1-500 falls in band 500, 501-1000 in band 1000, etc)
+FREQ_BAND_SIZE = 500
+
+_kanji_re = re.compile("[" + charset.kanji.re_range_block + "]")
 
 
 class KanjiDict(object):
@@ -13,22 +23,70 @@ class KanjiDict(object):
         self.reindex()
 
     def reindex(self):
-        self._kanji_index = {e["literal"]: e for e in self._data}
+        # Entries are wrapped once here and then shared by all lookups, so
+        # that the (lazily computed) derived fields on each KanjiDictEntry
+        # only ever need to be built once per kanji.
+        self._kanji_index = {e["literal"]: KanjiDictEntry(e) for e in self._data}
         meaning_index = {}
         for e in self._data:
+            kde = self._kanji_index[e["literal"]]
             for rmg in e["reading_meaning"]["rmgroup"]:
                 for lang, meanings in rmg["meaning"].items():
                     meaning_index.setdefault(lang, {})
                     for m in meanings:
-                        meaning_index[lang].setdefault(m, []).append(e)
+                        meaning_index[lang].setdefault(m, []).append(kde)
         self._meaning_index = meaning_index
 
+        # Dense integer ids for each kanji, plus per-id lookup tables of the
+        # attributes that profile() buckets on.
+        self._kanji_ids = {e["literal"]: i for i, e in enumerate(self._data)}
+        self._grades = tuple(e["misc"].get("grade") for e in self._data)
+        self._jlpt = tuple(e["misc"].get("jlpt") for e in self._data)
+        self._stroke_counts = tuple(e["misc"].get("stroke_count") for e in self._data)
+        self._freq_bands = tuple(_freq_band(e["misc"].get("freq")) for e in self._data)
+
     def get_kanji(self, kanji):
-        return KanjiDictEntry(self._kanji_index[kanji])
+        return self._kanji_index[kanji]
 
     def lookup_meaning(self, lang, meaning):
         mi = self._meaning_index.get(lang, {})
-        return [KanjiDictEntry(e) for e in mi.get(meaning, [])]
+        return list(mi.get(meaning, []))
+
+    def profile(self, text):
+        """
+        Count the kanji in `text` (a string, or an iterable of strings such as
+        an open file) and return a KanjiProfile bucketing them by grade, JLPT
+        level, stroke count and frequency band.
+        """
+        return self._profile_counts(count_kanji(text))
+
+    def profile_many(self, documents, workers=None, chunksize=16):
+        """
+        Profile each of the strings in `documents`, returning a list of
+        KanjiProfiles in the same order.  If `workers` is given, the documents
+        are scanned in a pool of that many processes.  (Only the counting is
+        done in the pool, so the workers never need to load the dictionary.)
+        """
+        if not workers or workers == 1:
+            return [self.profile(doc) for doc in documents]
+        with multiprocessing.Pool(workers) as pool:
+            return [self._profile_counts(c) for c in pool.imap(count_kanji, documents, chunksize)]
+
+    def _profile_counts(self, counts):
+        profile = KanjiProfile()
+        ids = self._kanji_ids
+        for kanji, n in counts.items():
+            profile.total += n
+            i = ids.get(kanji)
+            if i is None:
+                profile.unknown += n
+                continue
+            profile.grade[self._grades[i]] += n
+            profile.jlpt[self._jlpt[i]] += n
+            profile.stroke_count[self._stroke_counts[i]] += n
+            profile.freq_band[self._freq_bands[i]] += n
+        profile.kanji = counts
+        return profile
 
     def __getitem__(self, kanji):
         return self.get_kanji(kanji)
@@ -37,9 +95,53 @@ class KanjiDict(object):
         return "<{}: {} entries>".format(self.__class__.__name__, len(self._data))
 
 
+class KanjiProfile(object):
+    """
+    Kanji counts for a document, as returned by KanjiDict.profile().  Each of
+    the histogram attributes is a Counter keyed by the relevant value, with
+    None used for kanji which do not have that value in the dictionary.
+    Kanji which are not in the dictionary at all are only counted in `total`
+    and `unknown`.  `kanji` is a Counter of the individual kanji.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.unknown = 0
+        self.kanji = collections.Counter()
+        self.grade = collections.Counter()
+        self.jlpt = collections.Counter()
+        self.stroke_count = collections.Counter()
+        self.freq_band = collections.Counter()
+
+    def __repr__(self):
+        return "<{}: {} kanji ({} distinct)>".format(self.__class__.__name__, self.total, self.distinct)
+
+    @property
+    def distinct(self):
+        return len(self.kanji)
+
+    def __add__(self, other):
+        if not isinstance(other, KanjiProfile):
+            return NotImplemented
+        result = KanjiProfile()
+        for attr in ("total", "unknown"):
+            setattr(result, attr, getattr(self, attr) + getattr(other, attr))
+        for attr in ("kanji", "grade", "jlpt", "stroke_count", "freq_band"):
+            getattr(result, attr).update(getattr(self, attr))
+            getattr(result, attr).update(getattr(other, attr))
+        return result
+
+
 class KanjiDictEntry(object):
+    __slots__ = ("_data", "_on_readings", "_kun_readings", "_all_readings", "_nanori", "_meanings")
+
     def __init__(self, data):
         self._data = data
+        self._on_readings = None
+        self._kun_readings = None
+        self._all_readings = None
+        self._nanori = None
+        self._meanings = {}
 
     def __repr__(self):
         return "<{}: {!r}>".format(self.__class__.__name__, self.kanji)
@@ -81,24 +183,49 @@ class KanjiDictEntry(object):
     def grade(self):
         return self._data["misc"].get("grade")
 
+    def _readings_of_type(self, r_type):
+        rmgroups = self._data["reading_meaning"]["rmgroup"]
+        return tuple(r[""] for rmg in rmgroups for r in rmg["reading"].get(r_type, ()))
+
     @property
     def all_on_readings(self):
-        return [r[""] for rmg in self._data["reading_meaning"]["rmgroup"] for r in rmg["reading"].get("ja_on", [])]
+        if self._on_readings is None:
+            self._on_readings = self._readings_of_type("ja_on")
+        return self._on_readings
 
     @property
     def all_kun_readings(self):
-        return [r[""] for rmg in self._data["reading_meaning"]["rmgroup"] for r in rmg["reading"].get("ja_kun", [])]
+        if self._kun_readings is None:
+            self._kun_readings = self._readings_of_type("ja_kun")
+        return self._kun_readings
 
     @property
     def all_readings(self):
-        return self.all_on_readings + self.all_kun_readings
+        if self._all_readings is None:
+            self._all_readings = self.all_on_readings + self.all_kun_readings
+        return self._all_readings
 
     @property
     def nanori(self):
-        return self._data["reading_meaning"]["nanori"]
+        if self._nanori is None:
+            self._nanori = tuple(self._data["reading_meaning"]["nanori"])
+        return self._nanori
+
+    @property
+    def furigana_readings(self):
+        # Precomputed by the generator (see furigana.expand_readings()).  May
+        # be None if the dictionary data was generated by an older version.
+        return self._data.get("furigana_readings")
 
     def all_meanings(self, lang="en"):
-        return sum((rmg["meaning"][lang] for rmg in self._data["reading_meaning"]["rmgroup"]), [])
+        try:
+            return self._meanings[lang]
+        except KeyError:
+            pass
+        rmgroups = self._data["reading_meaning"]["rmgroup"]
+        meanings = tuple(m for rmg in rmgroups for m in rmg["meaning"].get(lang, ()))
+        self._meanings[lang] = meanings
+        return meanings
 
     @property
     def misc(self):
@@ -108,6 +235,22 @@ class KanjiDictEntry(object):
 KanjiDic = KanjiDict
 
 
+def _freq_band(freq):
+    if freq is None:
+        return None
+    return ((freq - 1) // FREQ_BAND_SIZE + 1) * FREQ_BAND_SIZE
+
+
+def count_kanji(text):
+    "Return a Counter of the kanji in `text` (a string or an iterable of strings)"
+    if isinstance(text, str):
+        text = (text,)
+    counts = collections.Counter()
+    for chunk in text:
+        counts.update(_kanji_re.findall(chunk))
+    return counts
+
+
 _dict = None
 
 
@@ -124,3 +267,7 @@ def get_kanji(kanji):
 
 def lookup_meaning(lang, meaning):
     return _default_kanjidict().lookup_meaning(lang, meaning)
+
+
+def profile(text):
+    return _default_kanjidict().profile(text)
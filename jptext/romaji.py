@@ -1,3 +1,5 @@
+import hashlib
+import pickle
 import re
 import unicodedata
 from . import charset
@@ -25,37 +27,171 @@ class EncodingChangeError(RomajiException):
     pass
 
 
+_consonants_re = re.compile("[bcdfghj-np-tv-z]*")
+
+
+def _split_nfc(text, form="NFC"):
+    """
+    Split text before its last starter character (i.e. the last point at
+    which normalization could be affected by anything appended to it).
+    Returns the rest of the text and the normalized text before it.
+    """
+    for i in range(len(text) - 1, -1, -1):
+        if not unicodedata.combining(text[i]):
+            return text[i:], unicodedata.normalize(form, text[:i])
+    return text, ""
+
+
+_encoding_tables = {}  # (encoding class, flags) -> (k_to_r_map, r_to_h_map, r_to_k_map, kana_morae)
+_saved_encoding_tables = {}  # Encoding._tables_key() -> tables, from load_encoding_tables()
+_tables_format = 2  # Changed whenever what goes in the tables does, so that old saved ones are ignored
+
+
+def save_encoding_tables(filename):
+    "Save the tables for every encoding used so far, for load_encoding_tables()"
+    tables = {cls(flags)._tables_key(): t for (cls, flags), t in list(_encoding_tables.items())}
+    with open(filename, "wb") as f:
+        pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_encoding_tables(filename):
+    """
+    Load tables saved by save_encoding_tables(), so that encodings don't need
+    to be built from scratch the first time they're used in this process.
+    Tables for encodings which have changed since they were saved are
+    ignored.
+    """
+    with open(filename, "rb") as f:
+        _saved_encoding_tables.update(pickle.load(f))
+
+
+def _translate_table(morae, mapping):
+    """
+    Return a function which finds anything which could make a mora more than
+    one character long, and a str.translate() table for converting text
+    without any of those.
+    """
+    chars = set(morae.sokuon) | morae.trailers | {"ー"}
+    complex_re = re.compile("[" + re.escape("".join(sorted(chars))) + "]").search
+    return complex_re, {ord(k): r for k, r in mapping.items() if len(k) == 1}
+
+
+class MoraScanner(object):
+    """
+    Recognizes kana morae the same way as the charset.*.sokuonmora_re
+    regexes (an optional sokuon, a large kana, an optional stress mark and an
+    optional combining small kana, or a single repeat/intraword/etc
+    character), along with any "ー" after them.  `scripts` is a sequence of
+    (sokuon, large, stresses, combining, singles) character sets, tried in
+    order (like the alternatives in the regexes).  regex.split() gives the
+    text between the morae and the morae themselves, alternately.
+    """
+
+    def __init__(self, scripts):
+        self.trailers = set()  # Anything which can come after a large kana
+        self.sokuon = set()
+        starts = set()  # Anything which could start a mora
+        alternatives = []
+        for sokuon, large, stresses, combining, singles in scripts:
+            self.trailers.update(stresses, combining)
+            self.sokuon.update(sokuon)
+            starts.update(sokuon, large, singles)
+            alternatives.append("[%s]?[%s][%s]?[%s]?" % tuple(map(re.escape, (sokuon, large, stresses, combining))))
+            alternatives.append("[%s]" % re.escape(singles))
+        # (The lookahead lets the regex skip over anything else quickly)
+        starts = re.escape("".join(sorted(starts)))
+        self.regex = re.compile("(?=[" + starts + "])((?:" + "|".join(alternatives) + ")ー?)")
+
+    @classmethod
+    def from_charsets(cls, *charsets, hybrid_sokuon=False):
+        scripts = []
+        for cs in charsets:
+            sokuon = cs.sokuon + (cs.hybrid_sokuon if hybrid_sokuon else "")
+            singles = cs.small_non_combining + cs.ligatures + cs.repeats + cs.intraword
+            scripts.append((sokuon, cs.large, cs.stresses, cs.combining, singles))
+        return cls(scripts)
+
+
+class _MoraTable(dict):
+    # Mora (including any "ー" after it) -> romaji without macrons, filled in
+    # as each new mora is seen
+    def __init__(self, mapping, long_vowels):
+        self.mapping = mapping
+        self.long_vowels = long_vowels
+
+    def __missing__(self, mora):
+        if len(mora) > 1 and mora[-1] == "ー":
+            romaji = self.mapping.get(mora[:-1], mora[:-1])
+            romaji += self.long_vowels.get(romaji[-1], romaji[-1])
+        else:
+            romaji = self.mapping.get(mora, mora)
+        self[mora] = romaji
+        return romaji
+
+
 class Encoding(object):
     base_mapping_info = ()
     trailing_sokuon = "-"
     auto_sokuon = True
     hybrid_sokuon = True
     romaji_regex = re.compile("(.*?)([bcdfghj-np-tv-z]*[aeiou]|n|$)([\u0300-\u036f]?)")
-    hiragana_regex = re.compile("(.*?)(" + charset.hiragana.sokuonmora_re + "|$)(ー?)")
-    katakana_regex = re.compile("(.*?)(" + charset.katakana.sokuonmora_re + "|$)(ー?)")
-    kana_regex = None  # Populated by default in __init__ instead.  Can be overridden here in subclasses, though.
+    hiragana_morae = MoraScanner.from_charsets(charset.hiragana)
+    katakana_morae = MoraScanner.from_charsets(charset.katakana)
+    kana_morae = None  # Populated by default in __init__ instead.  Can be overridden here in subclasses, though.
 
     def __init__(self, flags=KEXT_ALL):
         self.flags = flags
+        self._coders = {}
+        self._derived_tables = {}
+
+        # Building the tables is relatively slow, so it's only done once per
+        # encoding class and set of flags.  The tables are shared between
+        # instances until something changes them (see _unshare_tables()).
+        tables = _encoding_tables.get((type(self), flags))
+        if tables is None:
+            tables = _saved_encoding_tables.get(self._tables_key())
+            if tables is None:
+                tables = self._build_tables()
+            _encoding_tables[(type(self), flags)] = tables
+        self.k_to_r_map, self.r_to_h_map, self.r_to_k_map, kana_morae = tables
+        self._shared_tables = True
+
+        if self.kana_morae is None:
+            self.kana_morae = kana_morae
+
+    def _build_tables(self):
         self.k_to_r_map = {}
         self.r_to_h_map = {}
         self.r_to_k_map = {}
+        self._shared_tables = False
 
         for h, k, r, f in reversed(self.base_mapping_info):
-            if f == KEXT_NONE or (f & flags):
+            if f == KEXT_NONE or (f & self.flags):
                 self.set_encoding(h, k, r)
 
-        if self.kana_regex is None:
-            if self.hybrid_sokuon:
-                self.kana_regex = re.compile(
-                    "(.*?)(" + charset.hiragana.hybrid_sokuonmora_re + "|"
-                    + charset.katakana.hybrid_sokuonmora_re + "|$)(ー?)"
-                )
-            else:
-                self.kana_regex = re.compile(
-                    "(.*?)(" + charset.hiragana.sokuonmora_re + "|"
-                    + charset.katakana.sokuonmora_re + "|$)(ー?)"
-                )
+        kana_morae = None
+        if self.kana_morae is None:
+            kana_morae = MoraScanner.from_charsets(charset.hiragana, charset.katakana, hybrid_sokuon=self.hybrid_sokuon)
+        return self.k_to_r_map, self.r_to_h_map, self.r_to_k_map, kana_morae
+
+    def _tables_key(self):
+        # Identifies the tables for saving to disk, including a digest of
+        # everything they're built from so that stale ones are ignored
+        cls = type(self)
+        source = repr(
+            (_tables_format, cls.base_mapping_info, cls.auto_sokuon, cls.hybrid_sokuon, cls.kana_morae is None)
+        )
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        return (cls.__module__, cls.__qualname__, self.flags, digest)
+
+    def _unshare_tables(self):
+        # Copy-on-write for the shared tables
+        self.k_to_r_map = dict(self.k_to_r_map)
+        self.r_to_h_map = dict(self.r_to_h_map)
+        self.r_to_k_map = dict(self.r_to_k_map)
+        self._shared_tables = False
+        self._coders = {}
+        self._derived_tables = {}
 
     def __call__(self, flags=None):
         # This allows us to use a class or an instance of that class in the same way
@@ -68,6 +204,9 @@ class Encoding(object):
             auto_sokuon = self.auto_sokuon
         if hybrid_sokuon is None:
             hybrid_sokuon = self.hybrid_sokuon
+        # (The encoders and decoders use the mappings directly, but these are
+        # copies, so have to be rebuilt)
+        self._derived_tables = {}
         sokuon_romaji = romaji[0] + romaji  # Duplicate first letter
 
         if hiragana:
@@ -88,33 +227,87 @@ class Encoding(object):
                         self._set_katakana_encoding(charset.hiragana.sokuon + katakana, sokuon_romaji, direction & DIR_TO_ROMAJI)
 
     def _set_hiragana_encoding(self, kana, romaji, direction):
+        if self._shared_tables:
+            self._unshare_tables()
         if direction & DIR_TO_ROMAJI:
             self.k_to_r_map[kana] = romaji
         if direction & DIR_FROM_ROMAJI:
             self.r_to_h_map[romaji] = kana
 
     def _set_katakana_encoding(self, kana, romaji, direction):
+        if self._shared_tables:
+            self._unshare_tables()
         if direction & DIR_TO_ROMAJI:
             self.k_to_r_map[kana] = romaji
         if direction & DIR_FROM_ROMAJI:
             self.r_to_k_map[romaji] = kana
 
+    def _coder(self, key, factory, *args):
+        # Encoders and decoders don't keep any state between calls, so one of
+        # each kind can be shared by everything (including other threads).
+        # They also share the mappings, so set_encoding() still applies.
+        coder = self._coders.get(key)
+        if coder is None:
+            coder = self._coders.setdefault(key, factory(self, *args))
+        return coder
+
     def hiragana_encoder(self, on_invalid=ACTION_PASS, macron=None):
         # TODO: implement on_invalid
-        return Encoder(self, self.hiragana_regex, self.k_to_r_map, charset.hiragana.sokuon, macron)
+        return self._coder(
+            ("hiragana_encoder", macron),
+            Encoder,
+            self.hiragana_morae,
+            self.k_to_r_map,
+            charset.hiragana.sokuon,
+            macron,
+        )
 
     def katakana_encoder(self, on_invalid=ACTION_PASS, macron=None):
-        return Encoder(self, self.katakana_regex, self.k_to_r_map, charset.katakana.sokuon, macron)
+        return self._coder(
+            ("katakana_encoder", macron),
+            Encoder,
+            self.katakana_morae,
+            self.k_to_r_map,
+            charset.katakana.sokuon,
+            macron,
+        )
 
     def kana_encoder(self, on_invalid=ACTION_PASS, macron=None):
-        return Encoder(self, self.kana_regex, self.k_to_r_map, charset.hiragana.sokuon + charset.katakana.sokuon, macron)
+        return self._coder(
+            ("kana_encoder", macron),
+            Encoder,
+            self.kana_morae,
+            self.k_to_r_map,
+            charset.hiragana.sokuon + charset.katakana.sokuon,
+            macron,
+        )
 
     def hiragana_decoder(self, on_invalid=ACTION_PASS, macron="\u0302\u0303\u0304\u0305"):
-        return Decoder(self, self.romaji_regex, self.r_to_h_map, charset.hiragana.sokuon, macron)
+        return self._coder(
+            ("hiragana_decoder", macron), Decoder, self.romaji_regex, self.r_to_h_map, charset.hiragana.sokuon, macron
+        )
 
     def katakana_decoder(self, on_invalid=ACTION_PASS, macron="\u0302\u0303\u0304\u0305"):
-        return Decoder(self, self.romaji_regex, self.r_to_k_map, charset.katakana.sokuon, macron)
-
+        return self._coder(
+            ("katakana_decoder", macron), Decoder, self.romaji_regex, self.r_to_k_map, charset.katakana.sokuon, macron
+        )
+
+    def _incremental_tables(self, key, mapping):
+        tables = self._derived_tables.get(key)
+        if tables is None:
+            # "nn" is typed for ん, rather than the っん that auto-sokuon gives it
+            mapping = {r: k for r, k in mapping.items() if not r.startswith("nn")}
+            prefixes = frozenset(r[:i] for r in mapping for i in range(1, len(r)))
+            tables = self._derived_tables.setdefault(key, (mapping, prefixes))
+        return tables
+
+    def hiragana_incremental_decoder(self):
+        mapping, prefixes = self._incremental_tables("hiragana_incremental", self.r_to_h_map)
+        return IncrementalDecoder(self, mapping, prefixes, charset.hiragana.sokuon)
+
+    def katakana_incremental_decoder(self):
+        mapping, prefixes = self._incremental_tables("katakana_incremental", self.r_to_k_map)
+        return IncrementalDecoder(self, mapping, prefixes, charset.katakana.sokuon)
 
     def hiragana_to_romaji(self, text, on_invalid=ACTION_PASS, macron=None):
         return self.hiragana_encoder(on_invalid=on_invalid, macron=macron).encode(text)
@@ -125,6 +318,27 @@ class Encoding(object):
     def kana_to_romaji(self, text, on_invalid=ACTION_PASS, macron=None):
         return self.kana_encoder(on_invalid=on_invalid, macron=macron).encode(text)
 
+    def kana_to_romaji_many(self, strings, on_invalid=ACTION_PASS, macron=None):
+        """
+        Convert a batch of strings at once, returning a list.  Strings where
+        every mora is a single kana (no sokuon, yōon, "ー" or stress marks)
+        are converted with str.translate(), and only the rest go through the
+        full encoder.
+        """
+        encoder = self.kana_encoder(on_invalid=on_invalid, macron=macron)
+        if macron:
+            # Long vowels depend on the previous mora, so can't be translated
+            return [encoder.encode(text) for text in strings]
+        tables = self._derived_tables.get("kana_translate")
+        if tables is None:
+            tables = _translate_table(self.kana_morae, self.k_to_r_map)
+            tables = self._derived_tables.setdefault("kana_translate", tables)
+        complex_re, table = tables
+        normalize = unicodedata.normalize
+        return [
+            encoder.encode(text) if complex_re(text) else normalize("NFC", text.translate(table)) for text in strings
+        ]
+
     def romaji_to_hiragana(self, text, on_invalid=ACTION_PASS, macron="\u0302\u0303\u0304\u0305"):
         return self.hiragana_decoder(on_invalid=on_invalid, macron=macron).decode(text)
 
@@ -136,43 +350,134 @@ class Encoder(object):
     extended_vowel_map = {"a": "a", "i": "i", "u": "u", "e": "e", "o": "ou"}  # FIXME: should come from encoding
     macron_to_vowel_map = {"o": "u"}  # FIXME: should come from encoding
 
-    def __init__(self, encoding, regex, mapping, sokuon, macron=None):
+    def __init__(self, encoding, morae, mapping, sokuon, macron=None):
         self.encoding = encoding
         self.mapping = mapping
-        self.regex = regex
+        self.morae = morae
         self.sokuon = sokuon
         self.macron = macron
-        self.prev_char = None
 
     def encode(self, text):
-        text = self.regex.sub(self._transform_match, text)
-        text = unicodedata.normalize("NFC", text)
-        return text
-
-    def _transform_match(self, match):
-        pre, text, post = match.groups()
-        if text:
-            text = self.mapping.get(text, text)
-            if self.macron:
-                if not pre and text[0] in self.extended_vowel_map.get(self.prev_char, ""):
-                    text = self.macron
-                self.prev_char = text[-1] if text and not post else None
+        return unicodedata.normalize("NFC", "".join(self._encode(text, None, True)[0]))
+
+    def encode_stream(self, chunks):
+        """
+        Like encode(), but for text that arrives in pieces (e.g. lines from
+        a file), yielding the converted text as it goes.  Anything at the end
+        of a chunk that could still change depending on what comes next (a
+        sokuon, a mora that could be followed by a "ー", etc.) is held back
+        until the next chunk.
+        """
+        carry = ""
+        prev_char = None
+        pending = ""
+        for chunk in chunks:
+            text = carry + chunk
+            result, consumed, prev_char = self._encode(text, prev_char, False)
+            carry = text[consumed:]
+            pending, output = _split_nfc(pending + "".join(result))
+            if output:
+                yield output
+        result = self._encode(carry, prev_char, True)[0]
+        output = unicodedata.normalize("NFC", pending + "".join(result))
+        if output:
+            yield output
+
+    def _encode(self, text, prev_char, final):
+        # Split the text into morae and the text between them, and convert
+        # the morae.  (This handles the corner cases exactly as the regex
+        # substitution this replaced did, in particular newlines, which the
+        # regex's "." would not cross.)  Unless `final` is set, this stops
+        # before anything at the end of the text which might be affected by
+        # what follows it, and returns how much of the text was converted
+        # along with the state to carry on.
+        pieces = self.morae.regex.split(text)
+        consumed = len(text)
+        if final:
+            pieces[-1] = self._trailing_line(pieces[-1])
+        else:
+            consumed -= self._hold_back(pieces)
+        if self.macron:
+            prev_char = self._convert_macron(pieces, prev_char)
+        else:
+            table = self.encoding._derived_tables.get(("romaji", id(self.mapping)))
+            if table is None:
+                table = _MoraTable(self.mapping, self.macron_to_vowel_map)
+                table = self.encoding._derived_tables.setdefault(("romaji", id(self.mapping)), table)
+            pieces[1::2] = map(table.__getitem__, pieces[1::2])
+        return pieces, consumed, prev_char
+
+    def _convert_macron(self, pieces, prev_char):
+        # Convert the morae in `pieces` in place, with macrons for long
+        # vowels, and return the `prev_char` state for whatever comes next
+        get = self.mapping.get
+        macron = self.macron
+        extended_vowel_map = self.extended_vowel_map
+        result = []
+        for pre, mora in zip(pieces[::2], pieces[1::2]):
+            post = mora[-1] == "ー" and len(mora) > 1
             if post:
-                if self.macron:
-                    text += self.macron
-                else:
-                    text += self.macron_to_vowel_map.get(text[-1], text[-1])
-            return pre + text
-        elif pre:
-            # This only happens at the end of the input, if there's some sort
-            # of incomplete mora.  Check for a trailing sokuon (most likely
-            # situation here) and convert it if appropriate.
-            if self.encoding.trailing_sokuon and pre[0] in self.sokuon:
-                return self.encoding.trailing_sokuon + pre[1:]
-            return pre
+                mora = mora[:-1]
+            mora = get(mora, mora)
+            # (Like the regex's "(.*?)", the text before a mora starts after
+            # any newline in it)
+            if (not pre or pre[-1] == "\n") and mora[0] in extended_vowel_map.get(prev_char, ""):
+                mora = macron
+            if post:
+                prev_char = None
+                mora += macron
+            else:
+                prev_char = mora[-1]
+            result.append(mora)
+        pieces[1::2] = result
+        return prev_char
+
+    def _hold_back(self, pieces):
+        # Remove anything at the end of `pieces` which could change depending
+        # on what follows it, returning how many characters were removed
+        tail = pieces.pop()
+        if not tail and len(pieces) > 1:
+            # A mora, which could still get longer.  One character of the
+            # text before it goes with it, so that it still doesn't follow on
+            # directly from the previous mora if that's not empty.
+            mora = pieces.pop()
+            pre = pieces.pop()
+            pieces.append(pre[:-1])
+            return len(pre[-1:] + mora)
+        body_end = len(tail) - 1 if tail.endswith("\n") else len(tail)
+        line_start = tail.rfind("\n", 0, body_end) + 1
+        if line_start < body_end and tail[line_start] in self.sokuon:
+            # A trailing sokuon, which _trailing_line() would convert if
+            # there's nothing more on this line
+            cut = line_start
+        elif body_end < len(tail):
+            cut = len(tail)
         else:
-            # End of input.  Just ignore this.
-            return ''
+            # Keep any sokuon at the end, which could go with a kana in the
+            # next text, and at least one more character, so that the next
+            # mora won't be treated as following on directly from the last
+            cut = len(tail)
+            while cut > line_start and tail[cut - 1] in self.sokuon:
+                cut -= 1
+            cut = max(line_start, cut - 1)
+        pieces.append(tail[:cut])
+        return len(tail) - cut
+
+    def _trailing_line(self, text):
+        # Like a regex "$", the end of the text is before any final newline,
+        # and the regex's "(.*?)" doesn't go back past any other newline
+        body_end = len(text) - 1 if text.endswith("\n") else len(text)
+        line_start = text.rfind("\n", 0, body_end) + 1
+        if line_start < body_end and text[line_start] in self.sokuon:
+            return text[:line_start] + self._trailing(text[line_start:body_end]) + text[body_end:]
+        return text
+
+    def _trailing(self, text):
+        # Any incomplete mora at the end of the input.  Check for a trailing
+        # sokuon (most likely situation here) and convert it if appropriate.
+        if text and self.encoding.trailing_sokuon and text[0] in self.sokuon:
+            return self.encoding.trailing_sokuon + text[1:]
+        return text
 
 
 class Decoder(object):
@@ -191,6 +496,60 @@ class Decoder(object):
         text = unicodedata.normalize("NFC", text)
         return text
 
+    def decode_stream(self, chunks):
+        """
+        Like decode(), but for text that arrives in pieces (e.g. lines from
+        a file), yielding the converted text as it goes.  Incomplete
+        syllables, and combining characters which might still be followed by
+        more, are held back until the next chunk.
+        """
+        raw = ""
+        carry = ""
+        pending = ""
+        for chunk in chunks:
+            # Only decompose up to the last starter, so that the decomposition
+            # is the same as it would have been for the text as a whole
+            raw, text = _split_nfc(raw + chunk, "NFD")
+            text = carry + text
+            result, consumed = self._decode(text, False)
+            carry = text[consumed:]
+            pending, output = _split_nfc(pending + "".join(result))
+            if output:
+                yield output
+        text = carry + unicodedata.normalize("NFD", raw)
+        output = unicodedata.normalize("NFC", pending + "".join(self._decode(text, True)[0]))
+        if output:
+            yield output
+
+    def _decode(self, text, final):
+        # Equivalent to self.regex.sub(), but unless `final` is set, stops
+        # before the first match which might change given more text, and
+        # returns how much of the text was converted.
+        if final:
+            return [self.regex.sub(self._transform_match, text)], len(text)
+        result = []
+        consumed = 0
+        length = len(text)
+        for match in self.regex.finditer(text):
+            mora = match.group(2)
+            if not mora:
+                break
+            if match.end() == length or (
+                mora == "n" and not match.group(3) and _consonants_re.match(text, match.end()).end() == length
+            ):
+                # The syllable might turn out to start earlier, if it's
+                # preceded by consonants
+                start = match.start(2)
+                while start > match.start() and _consonants_re.match(text, start - 1, start).end() == start:
+                    start -= 1
+                result.append(text[consumed:start])
+                consumed = start
+                break
+            result.append(text[consumed : match.start()])
+            result.append(self._transform_match(match))
+            consumed = match.end()
+        return result, consumed
+
     def _transform_match(self, match):
         pre, text, post = match.groups()
         if text:
@@ -208,6 +567,72 @@ class Decoder(object):
             return pre
 
 
+class IncrementalDecoder(object):
+    """
+    Converts romaji to kana as it's typed, like an IME does.  Each call to
+    feed() takes the newly typed characters and returns the kana which is
+    now certain, along with the romaji which can't be converted yet (e.g.
+    "ky", or an "n" which could still become な etc).  "nn" and "n'" give
+    ん, and a doubled consonant gives a sokuon.
+    """
+
+    consonants = "bcdfghjklmpqrstvwxyz"
+
+    def __init__(self, encoding, mapping, prefixes, sokuon):
+        self.encoding = encoding
+        self.mapping = mapping
+        self.prefixes = prefixes  # Everything which could still become a syllable in the mapping
+        self.sokuon = sokuon
+        self.pending = ""
+
+    def feed(self, text):
+        result = []
+        for c in text.lower():
+            self.pending += c
+            self._resolve(result, False)
+        return "".join(result), self.pending
+
+    def flush(self):
+        "Convert whatever's left as best as possible, returning it"
+        result = []
+        self._resolve(result, True)
+        return "".join(result)
+
+    def reset(self):
+        self.pending = ""
+
+    def _resolve(self, result, final):
+        pending = self.pending
+        while pending:
+            if pending in self.prefixes and not final:
+                break
+            kana = self.mapping.get(pending)
+            if kana is not None:
+                result.append(kana)
+                pending = ""
+                break
+            first = pending[0]
+            if first == "n" and pending[1:2] in ("n", "'") and "n" in self.mapping:
+                result.append(self.mapping["n"])
+                pending = pending[2:]
+            elif first in self.consonants and (pending[1:2] == first or pending[:2] == "tc"):
+                result.append(self.sokuon)
+                pending = pending[1:]
+            else:
+                # Take the longest syllable at the start, if any (e.g. the "n"
+                # in "nk" or the "i" in "ic")
+                for end in range(len(pending) - 1, 0, -1):
+                    kana = self.mapping.get(pending[:end])
+                    if kana is not None:
+                        break
+                else:
+                    kana = first
+                    end = 1
+                result.append(kana)
+                pending = pending[end:]
+        self.pending = pending
+
+
 class ModifiedHepburnEncoding(Encoding):
     base_mapping_info = (
         ("あ", "ア", "a", KEXT_NONE),
@@ -410,3 +835,28 @@ _default_encoding = ModifiedHepburnEncoding()
 
 def kana_to_romaji(text, on_invalid=ACTION_PASS, macron=None):
     return _default_encoding.kana_to_romaji(text, on_invalid=on_invalid, macron=macron)
+
+
+def kana_to_romaji_many(strings, on_invalid=ACTION_PASS, macron=None):
+    return _default_encoding.kana_to_romaji_many(strings, on_invalid=on_invalid, macron=macron)
+
+
+_search_key_strip_re = re.compile("[\u0300-\u036f'\\- ]")
+_search_key_m_re = re.compile("m(?=[bmp])")
+_search_key_long_re = re.compile("o[ou]+|aa+|ii+|uu+|ee+")
+
+
+def search_key(text):
+    """
+    Normalize romaji (or kana, which is converted to romaji first) for
+    searching, so that the different ways of writing the same word all give
+    the same key.  Long vowels are shortened (tōkyō, toukyou and tookyoo all
+    become tokyo), "m" before b/m/p becomes "n" (shimbun -> shinbun), "wo"
+    becomes "o", and apostrophes and hyphens are dropped.  The keys are
+    lossy, so different words can have the same key.
+    """
+    text = unicodedata.normalize("NFD", kana_to_romaji(text).lower())
+    text = _search_key_strip_re.sub("", text)
+    text = _search_key_m_re.sub("n", text)
+    text = text.replace("wo", "o")
+    return _search_key_long_re.sub(lambda m: m.group()[0], text)
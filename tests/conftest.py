@@ -0,0 +1,93 @@
+import pytest
+
+from jptext import furigana
+from jptext import jmdict
+from jptext import kanjidic
+
+
+def make_kanji(literal, on=(), kun=(), meanings=(), nanori=(), grade=None, jlpt=None, stroke_count=None, freq=None):
+    readings = {}
+    if on:
+        readings["ja_on"] = [{"": r} for r in on]
+    if kun:
+        readings["ja_kun"] = [{"": r} for r in kun]
+    return {
+        "literal": literal,
+        "misc": {"grade": grade, "jlpt": jlpt, "stroke_count": stroke_count, "freq": freq},
+        "reading_meaning": {
+            "rmgroup": [{"reading": readings, "meaning": {"en": list(meanings)}}],
+            "nanori": list(nanori),
+        },
+    }
+
+
+KANJI_DATA = [
+    make_kanji("日", on=["ニチ", "ジツ"], kun=["ひ", "-び", "-か"], meanings=["day", "sun"], nanori=["あき"],
+               grade=1, jlpt=4, stroke_count=4, freq=1),
+    make_kanji("本", on=["ホン"], kun=["もと"], meanings=["book", "origin"], grade=1, jlpt=4, stroke_count=5, freq=10),
+    make_kanji("人", on=["ジン", "ニン"], kun=["ひと", "-り", "-と"], meanings=["person"],
+               grade=1, jlpt=4, stroke_count=2, freq=5),
+    make_kanji("食", on=["ショク", "ジキ"], kun=["く.う", "く.らう", "た.べる", "は.む"], meanings=["eat", "food"],
+               grade=2, jlpt=4, stroke_count=9, freq=328),
+    make_kanji("学", on=["ガク"], kun=["まな.ぶ"], meanings=["study", "learning"],
+               grade=1, jlpt=4, stroke_count=8, freq=63),
+    make_kanji("校", on=["コウ", "キョウ"], meanings=["school"], grade=1, jlpt=4, stroke_count=10, freq=294),
+    make_kanji("語", on=["ゴ"], kun=["かた.る", "かた.らう"], meanings=["word", "speech", "language"],
+               grade=2, jlpt=4, stroke_count=14, freq=301),
+    make_kanji("鬱", on=["ウツ"], kun=["ふさ.ぐ"], meanings=["gloom"], stroke_count=29),
+]
+
+
+@pytest.fixture
+def kanji_dict(monkeypatch):
+    "Install a small synthetic KanjiDict as the default dictionary"
+    kd = kanjidic.KanjiDict(KANJI_DATA)
+    monkeypatch.setattr(kanjidic, "_dict", kd)
+    furigana.clear_caches()
+    return kd
+
+
+def make_entry(ent_seq, kebs, rebs, pos_details=(), ke_pri=(), re_pri=()):
+    k_ele = [{"keb": k} for k in kebs]
+    for k in k_ele:
+        if ke_pri:
+            k["ke_pri"] = list(ke_pri)
+    r_ele = []
+    for r in rebs:
+        if isinstance(r, str):
+            r = {"reb": r}
+        if re_pri:
+            r.setdefault("re_pri", list(re_pri))
+        r_ele.append(r)
+    sense = {"pos": [], "pos_details": [dict(pd) for pd in pos_details], "gloss": {}}
+    return {"ent_seq": ent_seq, "k_ele": k_ele, "r_ele": r_ele, "sense": [sense]}
+
+
+def verb(subcat):
+    return {"cat": "verb", "subcat": subcat}
+
+
+JMDICT_DATA = [
+    make_entry(1, ["日本"], ["にほん", "にっぽん"], [{"cat": "noun", "subcat": None}], ke_pri=["news1"], re_pri=["news1"]),
+    make_entry(2, ["食べる", "喰べる"], ["たべる"], [verb("ichidan")], ke_pri=["ichi1"], re_pri=["ichi1"]),
+    make_entry(3, ["学校"], ["がっこう"], [{"cat": "noun", "subcat": None}], ke_pri=["ichi1", "news1"]),
+    make_entry(4, ["人"], ["ひと"], [{"cat": "noun", "subcat": None}], ke_pri=["ichi1"]),
+    make_entry(5, ["人"], ["にん"], [{"cat": "suffix", "subcat": None}]),
+    make_entry(6, ["学ぶ"], ["まなぶ"], [verb("godan")], ke_pri=["ichi1"]),
+    make_entry(7, [], ["する"], [verb("irregular")]),
+    make_entry(8, ["日本語"], ["にほんご"], [{"cat": "noun", "subcat": None}], ke_pri=["ichi1"]),
+]
+
+# Precomputed alignments, as produced by bin/generate_jmdict.py
+JMDICT_FURIGANA = {
+    ("日本", "にほん"): (1, 1, 1, 2),
+    ("日本", "にっぽん"): (1, 2, 1, 2),
+}
+
+
+@pytest.fixture
+def jm_dict(monkeypatch):
+    "Install a small synthetic JMDict as the default dictionary"
+    jmd = jmdict.JMDict(JMDICT_DATA, dict(JMDICT_FURIGANA))
+    monkeypatch.setattr(jmdict, "_dict", jmd)
+    return jmd
@@ -0,0 +1,21 @@
+import pytest
+
+from jptext.cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # Evicts "b", as "a" was used more recently
+    assert "b" not in cache
+    assert cache.get("c") == 3
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2}
+    cache.resize(1)
+    assert len(cache) == 1 and cache.evictions == 2
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == cache.misses == cache.evictions == 0
+    with pytest.raises(ValueError):
+        LRUCache(0)
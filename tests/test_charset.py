@@ -0,0 +1,175 @@
+import random
+import unicodedata
+
+import pytest
+
+from jptext import charset
+
+
+def test_script_of():
+    expected = {
+        "あ": charset.SCRIPT_HIRAGANA,
+        "ゞ": charset.SCRIPT_HIRAGANA,
+        "カ": charset.SCRIPT_KATAKANA,
+        "ー": charset.SCRIPT_KATAKANA,
+        "ｶ": charset.SCRIPT_KATAKANA_HALFWIDTH,
+        "日": charset.SCRIPT_KANJI,
+        "々": charset.SCRIPT_KANJI,
+        "。": charset.SCRIPT_PUNCTUATION,
+        "!": charset.SCRIPT_PUNCTUATION,
+        "３": charset.SCRIPT_NUMBER,
+        "3": charset.SCRIPT_NUMBER,
+        "a": charset.SCRIPT_LATIN,
+        "Ｚ": charset.SCRIPT_LATIN,
+        "é": charset.SCRIPT_OTHER,
+        "\U0001f600": charset.SCRIPT_OTHER,
+    }
+    assert {ch: charset.script_of(ch) for ch in expected} == expected
+
+
+def test_is_charset():
+    assert charset.is_hiragana("ひらがな、です")
+    assert not charset.is_hiragana("ひらがな、です", punctuation=False)
+    assert charset.is_katakana("カタカナ")
+    assert not charset.is_katakana("かたかな")
+    assert charset.is_kanji("日本語")
+    assert charset.is_jptext("日本語のテキスト")
+    assert charset.jptext_portions("abc日本語、def") == ["日本語"]
+    assert charset.jptext_portions("abc日本語、def", punctuation=True) == ["日本語、"]
+
+
+def test_script_runs():
+    text = "日本語のテキスト, 123ｶﾀｶﾅ!"
+    runs = list(charset.script_runs(text))
+    assert [(s, text[a:b]) for s, a, b in runs] == [
+        (charset.SCRIPT_KANJI, "日本語"),
+        (charset.SCRIPT_HIRAGANA, "の"),
+        (charset.SCRIPT_KATAKANA, "テキスト"),
+        (charset.SCRIPT_PUNCTUATION, ", "),
+        (charset.SCRIPT_NUMBER, "123"),
+        (charset.SCRIPT_KATAKANA_HALFWIDTH, "ｶﾀｶﾅ"),
+        (charset.SCRIPT_PUNCTUATION, "!"),
+    ]
+    for size in (1, 2, 5):
+        chunks = [text[i : i + size] for i in range(0, len(text), size)]
+        assert list(charset.script_runs(chunks)) == runs
+    assert list(charset.script_runs("")) == []
+    assert list(charset.script_runs(["é", "\U0001f600"])) == [(charset.SCRIPT_OTHER, 0, 2)]
+
+
+def test_normalizer():
+    steps = [
+        charset.ascii_fullwidth_to_halfwidth,
+        charset.katakana_halfwidth_to_fullwidth,
+        charset.katakana_to_hiragana,
+    ]
+    normalizer = charset.Normalizer(steps)
+    texts = ["ＡＢＣ　ｶﾀｶﾅ", "カタカナとひらがな", "ﾃｷｽﾄ１２３", ""]
+    expected = []
+    for text in texts:
+        for step in steps:
+            text = step(text)
+        expected.append(text)
+    assert normalizer.normalize_many(texts) == expected
+    # Voiced halfwidth katakana are composed
+    assert normalizer.normalize("ｶﾞｷﾞｸﾞ ﾊﾟﾝ ﾞ") == "がぎぐ ぱん ゛"
+    assert charset.Normalizer([charset.katakana_halfwidth_to_fullwidth]).normalize("ｳﾞｧｲｵﾘﾝ") == "ヴァイオリン"
+
+    with pytest.raises(ValueError):
+        charset.Normalizer([str.lower])
+
+
+def test_normalizer_made_halfwidth():
+    # Halfwidth katakana made by one step can combine with a ﾞ from the input
+    # in a later one
+    steps = [charset.katakana_fullwidth_to_halfwidth, charset.katakana_halfwidth_to_fullwidth]
+    for text in ["カﾞ", "ハﾟﾝ", "ｶﾞカﾞ゛"]:
+        expected = text
+        for step in steps:
+            expected = step(expected)
+        assert charset.Normalizer(steps).normalize(text) == expected
+    assert charset.Normalizer(steps).normalize("カﾞ") == "ガ"
+    # Marks which don't compose are converted separately
+    normalizer = charset.Normalizer([charset.katakana_halfwidth_to_fullwidth, charset.katakana_to_hiragana])
+    assert normalizer.normalize("ｶﾟｷﾞﾂﾟ") == "か゜ぎつ゜"
+    with pytest.raises(ValueError):
+        charset.Normalizer(steps + [str.lower])
+
+
+def old_katakana_fullwidth_to_halfwidth(text):
+    text = unicodedata.normalize("NFD", text)
+    text = text.translate(charset._kkfw_to_kkhw_trmap)
+    return unicodedata.normalize("NFC", text)
+
+
+def old_katakana_halfwidth_to_fullwidth(text):
+    # (With the voiced pairs composed, which the old version didn't do)
+    result = []
+    i = 0
+    while i < len(text):
+        fullwidth = text[i].translate(charset._kkhw_to_kkfw_trmap)
+        if text[i : i + 2] in charset._kkhw_voiced_to_kkfw:
+            fullwidth += {"ﾞ": "\u3099", "ﾟ": "\u309a"}[text[i + 1]]
+            i += 1
+        result.append(unicodedata.normalize("NFC", fullwidth))
+        i += 1
+    return "".join(result)
+
+
+def test_katakana_width_conversion():
+    # The same as the old NFD/NFC-based versions, except that those didn't
+    # handle voiced katakana properly
+    unvoiced = [c for c in charset.katakana.all if unicodedata.normalize("NFD", c) == c]
+    halfwidth = list(charset.katakana_halfwidth.all) + ["ﾞ", "ﾟ"] * 5
+    alphabet = unvoiced + halfwidth + list("ひらがなabc 、。")
+    rng = random.Random(4)
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+        assert charset.katakana_fullwidth_to_halfwidth(text) == old_katakana_fullwidth_to_halfwidth(text)
+        assert charset.katakana_halfwidth_to_fullwidth(text) == old_katakana_halfwidth_to_fullwidth(text)
+
+    assert charset.katakana_fullwidth_to_halfwidth("ガッコウ パン ヴァ がっこう") == "ｶﾞｯｺｳ ﾊﾟﾝ ｳﾞｧ がっこう"
+    assert charset.katakana_halfwidth_to_fullwidth("ｶﾞｯｺｳ ﾊﾟﾝ ｳﾞｧ ﾞ") == "ガッコウ パン ヴァ ゛"
+    # Marks which don't compose with the kana before them are left separate
+    assert charset.katakana_halfwidth_to_fullwidth("ｶﾟ ﾂﾟ ｳﾟ ｱﾞ") == "カ゜ ツ゜ ウ゜ ア゛"
+    for c in charset.katakana.large:
+        halfwidth = charset.katakana_fullwidth_to_halfwidth(c)
+        if halfwidth != c:
+            assert charset.katakana_halfwidth_to_fullwidth(halfwidth) == c
+    normalizer = charset.Normalizer([charset.katakana_fullwidth_to_halfwidth, charset.katakana_halfwidth_to_fullwidth])
+    assert normalizer.normalize("ガッコウ パン") == "ガッコウ パン"
+
+
+def test_morae():
+    assert charset.morae("がっこう") == ["が", "っ", "こ", "う"]
+    assert charset.morae("とうきょう、コーヒー") == ["と", "う", "きょ", "う", "コ", "ー", "ヒ", "ー"]
+    assert charset.morae("ｷｬﾝﾌﾟ") == ["ｷｬ", "ﾝ", "ﾌﾟ"]
+    assert charset.morae("ぁい゛") == ["ぁ", "い゛"]
+    assert charset.morae("abc") == []
+    assert charset.count_morae("ヴァイオリン") == 5
+    assert charset.count_morae_many(["ふるいけや", "かわずとびこむ", "みずのおと"]) == [5, 7, 5]
+
+
+def test_collation_key():
+    words = ["ぱぱ", "カナ", "ｶﾅ", "かな", "がな", "かっと", "かつ", "コーヒー", "こうひい", "abc", "ああ", "あ"]
+    assert sorted(words, key=charset.collation_key) == [
+        "abc",
+        "あ",
+        "ああ",
+        "かつ",
+        "かっと",
+        "かな",
+        "カナ",
+        "ｶﾅ",
+        "がな",
+        "こうひい",
+        "コーヒー",  # (i.e. こおひい)
+        "ぱぱ",
+    ]
+    assert charset.collation_key("ｶﾞ")[:1] == charset.collation_key("が")[:1] == charset.collation_key("か")[:1]
+    assert charset.collation_key("が") < charset.collation_key("ｶﾞ")
+    # Repeat marks, voiced and not
+    assert charset.collation_key("かゞ") == charset.collation_key("かが")
+    assert charset.collation_key("カヾ") == charset.collation_key("カガ")
+    assert charset.collation_key("かゝ") == charset.collation_key("かか")
+    assert charset.collation_key("カヽ") == charset.collation_key("カカ")
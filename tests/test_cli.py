@@ -0,0 +1,50 @@
+import io
+from multiprocessing.pool import ThreadPool
+import sys
+
+import pytest
+
+from jptext import cli
+
+
+def test_read_blocks():
+    text = "一行目\n二行目\n三行目"
+    blocks = list(cli.read_blocks(io.StringIO(text), chunk_size=4))
+    assert "".join(blocks) == text
+    assert all(block.endswith("\n") for block in blocks[:-1])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main(tmp_path, jobs, capsys):
+    infile = tmp_path / "in.txt"
+    outfile = tmp_path / "out.txt"
+    infile.write_text("ＡＢＣ　ｶﾞｯｺｳ\r\nとうきょう\nかっ\n" * 50, encoding="utf-8")
+    argv = [str(infile), "-o", str(outfile), "--fold-width", "--fold-kana", "hiragana", "--romaji", "--macron"]
+    cli.main(argv + ["--jobs", str(jobs), "--chunk-size", "16", "--stats"])
+    with open(str(outfile), encoding="utf-8", newline="") as f:
+        assert f.read() == "ABC gakkō\r\ntōkyō\nka-\n" * 50
+    assert "150 lines" in capsys.readouterr().err
+
+
+def test_imap_bounded():
+    taken = []
+
+    def items():
+        for i in range(20):
+            taken.append(i)
+            yield i
+
+    with ThreadPool(2) as pool:
+        results = cli.imap_bounded(pool, abs, items(), 4)
+        assert next(results) == 0
+        assert len(taken) == 5
+        assert list(results) == list(range(1, 20))
+
+
+def test_main_stdin(monkeypatch, capsys):
+    stdin = io.TextIOWrapper(io.BytesIO("ｶﾀｶﾅ ｶﾞ ｶﾟ\n".encode("utf-8")), encoding="utf-8")
+    monkeypatch.setattr(sys, "stdin", stdin)
+    monkeypatch.setattr(sys, "stdout", io.TextIOWrapper(io.BytesIO(), encoding="utf-8"))
+    cli.main(["--fold-width", "--jobs", "1"])
+    assert sys.stdout.buffer.getvalue().decode("utf-8") == "カタカナ ガ カ゜\n"
+    assert not stdin.buffer.closed
@@ -0,0 +1,182 @@
+import io
+import sys
+
+import pytest
+
+import jptext
+from jptext import furigana
+from jptext import jmdict
+from jptext import kanjidic
+
+pytestmark = pytest.mark.usefixtures("kanji_dict")
+
+
+def test_match_furi_exact(kanji_dict):
+    assert furigana.match_furi("日本語", "にちほんご") == [("日", "にち"), ("本", "ほん"), ("語", "ご")]
+    assert furigana.match_furi("食", "たべる") == [("食", "たべる")]
+
+
+def test_match_furi_one_wildcard(kanji_dict):
+    assert furigana.match_furi("日本", "にほん") == [("日", "に"), ("本", "ほん")]
+    # The earliest kanji which makes things fit is the one left unmatched
+    assert furigana.match_furi("日本", "やほん") == [("日", "や"), ("本", "ほん")]
+    assert furigana.match_furi("日本", "にちや") == [("日", "にち"), ("本", "や")]
+
+
+def test_match_furi_sound_changes(kanji_dict):
+    assert furigana.match_furi("学校", "がっこう") == [("学", "がっ"), ("校", "こう")]
+    assert furigana.match_furi("鬱人", "うつびと") == [("鬱", "うつ"), ("人", "びと")]
+    assert furigana.match_furi("食", "た") == [("食", "た")]
+    # Plain readings win over derived ones when both fit
+    assert furigana.match_furi("本本", "ほんぼん") == [("本", "ほん"), ("本", "ぼん")]
+
+
+def test_expand_readings():
+    expanded = furigana.expand_readings(["ガク", "まな.ぶ", "-ひと"])
+    assert expanded["がく"] == 0
+    assert expanded["まなぶ"] == 0
+    assert expanded["まな"] == furigana.READING_OKURIGANA_STEM
+    assert expanded["がっ"] == furigana.READING_SOKUON
+    assert expanded["びと"] == furigana.READING_RENDAKU
+    assert expanded["ぴと"] == furigana.READING_RENDAKU
+    assert "ぱっ" not in expanded
+
+
+def test_match_furi_unknown_kanji(kanji_dict):
+    assert furigana.match_furi("謎学", "なぞがく") == [("謎", "なぞ"), ("学", "がく")]
+
+
+def test_match_furi_group_fallback(kanji_dict):
+    assert furigana.match_furi("日本人", "やまと") == [("日本人", "やまと")]
+
+
+def test_apply_furi(kanji_dict, jm_dict):
+    assert furigana.apply_furi("日本語を学ぶ", "にほんごをまなぶ") == [
+        ("日", "に"),
+        ("本", "ほん"),
+        ("語", "ご"),
+        ("を", None),
+        ("学", "まな"),
+        ("ぶ", None),
+    ]
+    assert furigana.furi_html("人", "ひと") == "<ruby><rb>人</rb><rt>ひと</rt></ruby>"
+
+
+def test_apply_furi_uses_jmdict_table(jm_dict):
+    assert jm_dict.lookup_furigana("日本", "にほん") == [("日", "に"), ("本", "ほん")]
+    with pytest.raises(KeyError):
+        jm_dict.lookup_furigana("日本", "やまと")
+    # A table entry wins over what the kanji readings alone would give
+    assert furigana.apply_furi("学校", "がっこう") == [("学", "がっ"), ("校", "こう")]
+    jm_dict._furigana[("学校", "がっこう")] = (2, 4)
+    assert furigana.apply_furi("学校", "がっこう") == [("学校", "がっこう")]
+    jm_dict._furigana[("食べる", "たべる")] = (1, 1, 2, 0)
+    assert furigana.apply_furi("食べる", "たべる") == [("食", "た"), ("べる", None)]
+
+
+def test_apply_furi_without_jmdict(monkeypatch):
+    # Only kanjidic is needed when the JMdict data hasn't been generated
+    monkeypatch.setattr(jmdict, "_dict", None)
+    monkeypatch.delattr(jptext, "_jmdict_data", raising=False)
+    monkeypatch.setitem(sys.modules, "jptext._jmdict_data", None)
+    assert furigana.apply_furi("日本を", "にほんを") == [("日", "に"), ("本", "ほん"), ("を", None)]
+    assert furigana.furi_html("人", "ひと") == "<ruby><rb>人</rb><rt>ひと</rt></ruby>"
+    assert furigana.apply_furi_many([("学校", "がっこう")], workers=2) == [[("学", "がっ"), ("校", "こう")]]
+
+
+def test_apply_furi_many(jm_dict):
+    pairs = [("日本", "にほん"), ("学校", "がっこう"), ("日本", "にほん"), ("本を", "ほんを")]
+    expected = [furigana.apply_furi(*pair) for pair in pairs]
+    assert furigana.apply_furi_many(pairs) == expected
+    assert furigana.apply_furi_many(iter(pairs), workers=2) == expected
+    with pytest.raises(furigana.FuriganaError):
+        furigana.apply_furi_many([("本を", "ほんが")], workers=2)
+
+
+def test_caches(jm_dict):
+    furigana.match_furi("学校", "がっこう")
+    furigana.match_furi("学校", "がっこう")
+    assert furigana.alignment_cache.hits == 1
+    assert furigana.alignment_cache.misses == 1
+    furigana.apply_furi("日本を", "にほんを")
+    furigana.apply_furi("学校を", "がっこうを")
+    assert furigana.pattern_cache.stats()["size"] == 1
+    furigana.clear_caches()
+    assert len(furigana.alignment_cache) == len(furigana.pattern_cache) == 0
+
+
+def test_caches_follow_kanjidic(monkeypatch):
+    assert furigana.match_furi("学校", "がっこう") == [("学", "がっ"), ("校", "こう")]
+    # With no readings known, the kanji can match anything
+    monkeypatch.setattr(kanjidic, "_dict", kanjidic.KanjiDict([]))
+    assert furigana.match_furi("学校", "がっこう") == [("学", "がっこ"), ("校", "う")]
+
+
+def test_renderers():
+    lines = [[("日", "に"), ("本", "ほん"), ("を", None)], [("学", "まな"), ("ぶ", None), ("<", None)]]
+    out = io.StringIO()
+    furigana.HTMLRubyRenderer().write(lines, out)
+    assert out.getvalue() == (
+        "<ruby><rb>日</rb><rt>に</rt><rb>本</rb><rt>ほん</rt><rb>を</rb><rt></rt></ruby>\n"
+        "<ruby><rb>学</rb><rt>まな</rt><rb>ぶ</rb><rt></rt><rb>&lt;</rb><rt></rt></ruby>\n"
+    )
+    assert list(furigana.AnkiRenderer().render_lines(lines)) == ["日[に] 本[ほん]を", "\n", "学[まな]ぶ<", "\n"]
+    assert list(furigana.JSONLinesRenderer().render_lines(lines[:1])) == [
+        '[["日", "に"], ["本", "ほん"], ["を", null]]',
+        "\n",
+    ]
+
+
+def test_write_furi(jm_dict):
+    out = io.StringIO()
+    furigana.write_furi([("日本", "にほん"), ("人", "ひと")], out, furigana.AnkiRenderer())
+    assert out.getvalue() == "日[に] 本[ほん]\n人[ひと]\n"
+
+
+def test_infer_furi(jm_dict):
+    assert jm_dict.best_reading("日本") == "にほん"
+    assert jm_dict.best_reading("食べ") == "たべ"
+    assert jm_dict.best_reading("人") == "ひと"
+    text = "日本語を食べた。\n学校の謎の人が学んだ\n\n"
+    expected = [
+        ("日", "に"),
+        ("本", "ほん"),
+        ("語", "ご"),
+        ("を", None),
+        ("食", "た"),
+        ("べた。\n", None),
+        ("学", "がっ"),
+        ("校", "こう"),
+        ("の謎の", None),
+        ("人", "ひと"),
+        ("が", None),
+        ("学", "まな"),
+        ("んだ\n\n", None),
+    ]
+    assert list(furigana.infer_furi(text)) == expected
+    # Chunking the input must not change the results
+    assert list(furigana.infer_furi(iter(text))) == expected
+    assert list(furigana.infer_furi_lines(text)) == [
+        expected[:5] + [("べた。", None)],
+        expected[6:12] + [("んだ", None)],
+        [],
+    ]
+
+    out = io.StringIO()
+    furigana.write_inferred_furi(["日本", "人"], out, furigana.AnkiRenderer())
+    assert out.getvalue() == "日[に] 本[ほん] 人[ひと]\n"
+
+
+def test_match_outcomes():
+    outcomes = []
+    furigana.align_furi("日本語を学ぶ", "にちほんごをまなぶ", outcomes)
+    furigana.match_furi("日本", "にほん", outcomes)
+    furigana.match_furi("日本", "にほん", outcomes)
+    furigana.match_furi("日本人", "やまと", outcomes)
+    assert outcomes == [
+        furigana.MATCH_EXACT,
+        furigana.MATCH_EXACT,
+        furigana.MATCH_WILDCARD,
+        furigana.MATCH_WILDCARD,
+        furigana.MATCH_GROUP,
+    ]
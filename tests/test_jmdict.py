@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import make_entry
+from jptext import jmdict
+
+
+def seqs(entries):
+    return [e.ent_seq for e in entries]
+
+
+def test_lookup_romaji(jm_dict):
+    assert seqs(jm_dict.lookup_romaji("taberu")) == [2]
+    assert seqs(jm_dict.lookup_romaji("gakkō")) == [3]
+    assert seqs(jm_dict.lookup_romaji("gakkou")) == [3]
+    assert seqs(jm_dict.lookup_romaji("NIPPON")) == [1]
+    assert seqs(jmdict.lookup_romaji("hito")) == [4]
+    with pytest.raises(KeyError):
+        jm_dict.lookup_romaji("sushi")
+
+
+def test_lookup_romaji_prefix(jm_dict):
+    assert seqs(jm_dict.lookup_romaji_prefix("ni")) == [1, 8, 5]
+    assert seqs(jm_dict.lookup_romaji_prefix("ni", limit=2)) == [1, 8]
+    assert jm_dict.lookup_romaji_prefix("xyz") == []
+
+
+def test_lookup_romaji_precomputed():
+    # Keys from the generator are used as they are
+    jmd = jmdict.JMDict([make_entry(1, ["東京"], [{"reb": "とうきょう", "romaji": "edo"}])], {})
+    assert seqs(jmd.lookup_romaji("edo")) == [1]
+
+
+def test_sorted_readings(jm_dict):
+    assert [r for r, e in jm_dict.sorted_readings()] == [
+        "がっこう",
+        "する",
+        "たべる",
+        "にっぽん",
+        "にほん",
+        "にほんご",
+        "にん",
+        "ひと",
+        "まなぶ",
+    ]
+
+
+def test_verb_type(jm_dict):
+    assert jm_dict.verb_type("食べる") == jm_dict.verb_type("たべる") == "ichidan"
+    assert jm_dict.verb_type("学ぶ") == "godan"
+    assert jm_dict.verb_type("する") == "irregular"
+    assert jm_dict.verb_type("日本") is None
+    with pytest.raises(KeyError):
+        jm_dict.verb_type("寿司")
+
+
+def test_conj_verb_verb_type(jm_dict, monkeypatch):
+    from jptext import conj
+
+    # The verb type comes from the index, without going through lookup()
+    monkeypatch.setattr(jm_dict, "lookup", None)
+    assert [conj.conj_verb(w, "mstem", jmdict=jm_dict) for w in ("食べる", "学ぶ", "する")] == ["食べ", "学び", "し"]
+    with pytest.raises(ValueError):
+        conj.conj_verb("日本", "mstem", jmdict=jm_dict)
+    with pytest.raises(ValueError):
+        conj.conj_verb("寿司", "mstem", jmdict=jm_dict)
@@ -0,0 +1,50 @@
+import pytest
+
+from jptext import kanjidic
+
+
+def test_get_kanji_shares_entries(kanji_dict):
+    assert kanji_dict.get_kanji("日") is kanji_dict.get_kanji("日")
+    assert kanjidic.get_kanji("日") is kanji_dict["日"]
+    assert kanji_dict.lookup_meaning("en", "day") == [kanji_dict["日"]]
+    with pytest.raises(KeyError):
+        kanji_dict.get_kanji("x")
+
+
+def test_entry_fields(kanji_dict):
+    kde = kanji_dict["日"]
+    assert kde.all_on_readings == ("ニチ", "ジツ")
+    assert kde.all_kun_readings == ("ひ", "-び", "-か")
+    assert kde.all_readings == ("ニチ", "ジツ", "ひ", "-び", "-か")
+    assert kde.all_readings is kde.all_readings
+    assert kde.nanori == ("あき",)
+    assert kde.all_meanings() == ("day", "sun")
+    assert kde.all_meanings("fr") == ()
+    assert not hasattr(kde, "__dict__")
+
+
+def test_profile(kanji_dict):
+    prof = kanji_dict.profile(["日本語を学ぶ人", "日本人、鬱！々x"])
+    assert prof.total == 9
+    assert prof.distinct == 6
+    assert prof.unknown == 0
+    assert prof.grade == {1: 7, 2: 1, None: 1}
+    assert prof.jlpt == {4: 8, None: 1}
+    assert prof.stroke_count[4] == 2
+    assert prof.freq_band == {500: 8, None: 1}
+    assert kanjidic.profile("未").unknown == 1
+
+
+def test_profile_many(kanji_dict):
+    docs = ["日本", "学校の人", "", "語"]
+    serial = kanji_dict.profile_many(docs)
+    pooled = kanji_dict.profile_many(docs, workers=2)
+    assert [p.total for p in serial] == [2, 3, 0, 1]
+    assert [p.grade for p in pooled] == [p.grade for p in serial]
+    combined = sum(serial[1:], serial[0])
+    assert combined.total == 6
+    assert combined.grade == {1: 5, 2: 1}
+    # Kanji which appear in more than one document are only counted once
+    assert (serial[0] + serial[0]).distinct == 2
+    assert combined.distinct == 6
+    assert combined.kanji["日"] == 1
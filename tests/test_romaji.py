@@ -0,0 +1,219 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+import re
+import unicodedata
+
+import pytest
+
+from jptext import charset, romaji
+
+
+class RegexEncoder(romaji.Encoder):
+    # The original regex-based encoder, kept as a reference for the scanner
+    def __init__(self, encoding, regex, mapping, sokuon, macron=None):
+        super().__init__(encoding, None, mapping, sokuon, macron)
+        self.regex = regex
+        self.prev_char = None
+
+    def encode(self, text):
+        return unicodedata.normalize("NFC", self.regex.sub(self._transform_match, text))
+
+    def _transform_match(self, match):
+        pre, text, post = match.groups()
+        if text:
+            text = self.mapping.get(text, text)
+            if self.macron:
+                if not pre and text[0] in self.extended_vowel_map.get(self.prev_char, ""):
+                    text = self.macron
+                self.prev_char = text[-1] if text and not post else None
+            if post:
+                if self.macron:
+                    text += self.macron
+                else:
+                    text += self.macron_to_vowel_map.get(text[-1], text[-1])
+            return pre + text
+        elif pre:
+            return self._trailing(pre)
+        return ""
+
+
+def regex_encoders(encoding, macron):
+    sokuon = charset.hiragana.sokuon + charset.katakana.sokuon
+    kana_re = re.compile(
+        "(.*?)(" + charset.hiragana.hybrid_sokuonmora_re + "|" + charset.katakana.hybrid_sokuonmora_re + "|$)(ー?)"
+    )
+    hiragana_re = re.compile("(.*?)(" + charset.hiragana.sokuonmora_re + "|$)(ー?)")
+    katakana_re = re.compile("(.*?)(" + charset.katakana.sokuonmora_re + "|$)(ー?)")
+    return [
+        (encoding.kana_encoder, lambda: RegexEncoder(encoding, kana_re, encoding.k_to_r_map, sokuon, macron)),
+        (
+            encoding.hiragana_encoder,
+            lambda: RegexEncoder(encoding, hiragana_re, encoding.k_to_r_map, charset.hiragana.sokuon, macron),
+        ),
+        (
+            encoding.katakana_encoder,
+            lambda: RegexEncoder(encoding, katakana_re, encoding.k_to_r_map, charset.katakana.sokuon, macron),
+        ),
+    ]
+
+
+def check_same(texts, macron):
+    encoding = romaji.ModifiedHepburnEncoding()
+    for new, old in regex_encoders(encoding, macron):
+        for text in texts:
+            assert new(macron=macron).encode(text) == old().encode(text), repr(text)
+
+
+@pytest.mark.parametrize("macron", [None, "̄"])
+def test_encoder_matches_regex(macron):
+    encoding = romaji.ModifiedHepburnEncoding()
+    keys = list(encoding.k_to_r_map)
+    check_same(keys + [a + b for a in keys[:80] for b in keys[:80]], macron)
+
+    alphabet = "かきゃっッカキャーぁァいうおゝ゛゜ゞ・ a\n"
+    rng = random.Random(0)
+    check_same(["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8))) for _ in range(20000)], macron)
+
+
+def test_encoder_matches_regex_jmdict():
+    from jptext import jmdict
+
+    pytest.importorskip("jptext._jmdict_data")
+    readings = list(jmdict._default_jmdict()._kana_index)
+    check_same(readings, None)
+    check_same(readings, "̄")
+
+
+def test_kana_to_romaji():
+    assert romaji.kana_to_romaji("かっこーいい") == "kakkouii"
+    assert romaji.kana_to_romaji("とうきょう", macron="̄") == "tōkyō"
+    assert romaji.kana_to_romaji("かっ\nき") == "kaっ\nki"
+    assert romaji.kana_to_romaji("かっ\n") == "ka-\n"
+
+
+def test_shared_coders():
+    encoding = romaji.ModifiedHepburnEncoding()
+    assert encoding.kana_encoder() is encoding.kana_encoder()
+    assert encoding.kana_encoder(macron="̄") is not encoding.kana_encoder()
+    assert encoding.hiragana_decoder() is encoding.hiragana_decoder()
+
+    texts = ["とうきょう", "おおさか", "ぎゅうにゅう", "コーヒー"] * 250
+    expected = [romaji.kana_to_romaji(t, macron="̄") for t in texts]
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(lambda t: romaji.kana_to_romaji(t, macron="̄"), texts)) == expected
+
+
+def random_chunks(rng, text):
+    chunks = []
+    while text:
+        n = rng.randint(0, 4)
+        chunks.append(text[:n])
+        text = text[n:]
+    return chunks
+
+
+@pytest.mark.parametrize("macron", [None, "̄"])
+def test_encode_stream(macron):
+    encoder = romaji.ModifiedHepburnEncoding().kana_encoder(macron=macron)
+    alphabet = "かきゃっッカキャーぁァいうおゝ゛゜ゞ・ ań\n"
+    rng = random.Random(1)
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        assert "".join(encoder.encode_stream(random_chunks(rng, text))) == encoder.encode(text), repr(text)
+
+
+def test_decode_stream():
+    decoder = romaji.ModifiedHepburnEncoding().hiragana_decoder()
+    alphabet = ["a", "o", "n", "k", "s", "h", "y", "t", "-", "'", " ", "\n", "̄", "ō", "x"]
+    rng = random.Random(2)
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        assert "".join(decoder.decode_stream(random_chunks(rng, text))) == decoder.decode(text), repr(text)
+    assert "".join(decoder.decode_stream(["tōkyō ", "no gakkou\n", "desu"])) == "とうきょう の がっこう\nです"
+
+
+def test_encoding_tables_cached(tmp_path, monkeypatch):
+    a = romaji.ModifiedHepburnEncoding(romaji.KEXT_ANSI)
+    b = romaji.ModifiedHepburnEncoding(romaji.KEXT_ANSI)
+    assert a.k_to_r_map is b.k_to_r_map and a.kana_morae is b.kana_morae
+    assert romaji.ModifiedHepburnEncoding().k_to_r_map is not a.k_to_r_map
+
+    # Changing one instance's mapping doesn't affect the others
+    encoder = b.kana_encoder()
+    b.set_encoding("を", "ヲ", "wo")
+    assert b.kana_to_romaji("を") == "wo"
+    assert a.kana_to_romaji("を") == "o"
+    assert b.kana_encoder() is not encoder
+
+    filename = str(tmp_path / "tables.pickle")
+    romaji.save_encoding_tables(filename)
+    monkeypatch.setattr(romaji, "_encoding_tables", {})
+    monkeypatch.setattr(romaji, "_saved_encoding_tables", {})
+    romaji.load_encoding_tables(filename)
+    c = romaji.ModifiedHepburnEncoding(romaji.KEXT_ANSI)
+    assert c.k_to_r_map == a.k_to_r_map and c.k_to_r_map is not a.k_to_r_map
+    assert c.kana_to_romaji("ヴァイオリン") == "vaiorin"
+
+
+def test_incremental_decoder():
+    decoder = romaji.ModifiedHepburnEncoding().hiragana_incremental_decoder()
+    assert decoder.feed("k") == ("", "k")
+    assert decoder.feed("y") == ("", "ky")
+    assert decoder.feed("o") == ("きょ", "")
+    assert decoder.feed("n") == ("", "n")
+    assert decoder.feed("k") == ("ん", "k")
+    assert decoder.feed("ka") == ("っか", "")
+    assert decoder.feed("konnnichiha") == ("こんにちは", "")
+    assert decoder.feed("kan'i") == ("かん", "i")
+    assert decoder.feed("matcha") == ("いまっちゃ", "")
+    assert decoder.feed("SHIN") == ("し", "n")
+    assert decoder.flush() == "ん"
+    assert decoder.pending == ""
+
+    decoder = romaji.ModifiedHepburnEncoding().katakana_incremental_decoder()
+    typed = [decoder.feed(c)[0] for c in "konpyuutaa"]
+    assert "".join(typed) + decoder.flush() == "コンピュウタア"
+
+
+def test_search_key():
+    for text in ["tōkyō", "toukyou", "Tookyoo", "とうきょう", "トーキョー"]:
+        assert romaji.search_key(text) == "tokyo"
+    assert romaji.search_key("shimbun") == romaji.search_key("しんぶん") == "shinbun"
+    assert romaji.search_key("ほんを") == romaji.search_key("hon wo") == "hono"
+
+
+def test_kana_to_romaji_many():
+    alphabet = "かきゃっッカキャーぁァいうおゝ゛゜ゞ・ a\nは"
+    rng = random.Random(3)
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 6))) for _ in range(5000)]
+    texts += ["たべる", "カタカナ", "がっこう", "コーヒー", "ひらがな and English"]
+    for macron in (None, "̄"):
+        expected = [romaji.kana_to_romaji(t, macron=macron) for t in texts]
+        assert romaji.kana_to_romaji_many(texts, macron=macron) == expected
+
+
+def test_incremental_tables_follow_set_encoding():
+    encoding = romaji.ModifiedHepburnEncoding()
+    assert encoding.hiragana_incremental_decoder().feed("ka") == ("か", "")
+    encoding.set_encoding("く", "ク", "ka")
+    assert encoding.hiragana_incremental_decoder().feed("ka") == ("く", "")
+    encoding.set_encoding("こ", "コ", "ka")
+    assert encoding.hiragana_incremental_decoder().feed("ka") == ("こ", "")
+
+
+def test_kana_to_romaji_many_follows_set_encoding():
+    encoding = romaji.ModifiedHepburnEncoding()
+    assert encoding.kana_to_romaji_many(["を"]) == ["o"]
+    encoding.set_encoding("を", "ヲ", "wo")
+    assert encoding.kana_to_romaji_many(["を"]) == ["wo"]
+    encoding.set_encoding("を", "ヲ", "uo")
+    assert encoding.kana_to_romaji_many(["を"]) == ["uo"]
+
+
+def test_encoder_follows_set_encoding():
+    encoding = romaji.ModifiedHepburnEncoding()
+    encoding.set_encoding("を", "ヲ", "wo")
+    encoder = encoding.kana_encoder()
+    assert encoder.encode("をー") == "wou"
+    encoding.set_encoding("を", "ヲ", "uo")
+    assert encoder.encode("をー") == "uou"